@@ -1,27 +1,223 @@
 from dotenv import load_dotenv
-import os,asyncio
+import os,asyncio,argparse,time
+from collections import deque
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 
 load_dotenv()
 os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp") 
+llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp")
 
+SYSTEM_MESSAGE = "Eres un asistente que ayuda a los usuarios en Español."
 
-async def main():
+
+def estimate_tokens(text):
+    """
+    Estimación rápida de tokens (unos 4 caracteres por token) para no pedir el
+    recuento al servicio en cada turno.
+
+    Args:
+        text (str): Texto a medir.
+
+    Returns:
+        int: Tokens aproximados (al menos 1 si hay texto).
+    """
+    return (len(text) + 3) // 4
+
+
+class Conversation:
+    """
+    Una conversación con historial acotado: se guardan los últimos mensajes
+    mientras quepan en `max_history_tokens` (el mensaje de sistema no cuenta)
+    y, al superarlo, se descartan los pares pregunta/respuesta más antiguos.
+    El historial se mantiene entre turnos en vez de rehacerse cada vez.
+
+    Ejemplo:
+        conversation = Conversation(llm)
+        stats = await conversation.ask("Hola")
+    """
+
+    def __init__(self, llm, system=SYSTEM_MESSAGE, max_history_tokens=2000, name="Gemini", echo=True):
+        """
+        Args:
+            llm (BaseChatModel): Modelo de LangChain con `astream`.
+            system (str, opcional): Mensaje de sistema.
+            max_history_tokens (int, opcional): Tokens máximos del historial. Por defecto 2000.
+            name (str, opcional): Prefijo con el que se imprime la respuesta.
+            echo (bool, opcional): Si False no se imprimen los tokens (p. ej. con muchas conversaciones).
+        """
+        self.llm = llm
+        self.system = system
+        self.max_history_tokens = max_history_tokens
+        self.name = name
+        self.echo = echo
+        self.history = deque()
+        self.history_tokens = 0
+        self.turns = []
+
+    def _trim(self):
+        # Se quitan pares completos para que el historial siempre empiece por una pregunta.
+        while self.history and self.history_tokens > self.max_history_tokens:
+            for _ in range(2):
+                _, _, tokens = self.history.popleft()
+                self.history_tokens -= tokens
+
+    def _append(self, role, content):
+        tokens = estimate_tokens(content)
+        self.history.append((role, content, tokens))
+        self.history_tokens += tokens
+
+    def messages(self, message):
+        """Mensajes que se envían al modelo: sistema, historial y la pregunta nueva."""
+        return [("system", self.system)] + [(role, content) for role, content, _ in self.history] + [("human", message)]
+
+    async def ask(self, message):
+        """
+        Envía una pregunta y escribe la respuesta según llegan los tokens.
+
+        Args:
+            message (str): Pregunta del usuario.
+
+        Returns:
+            dict: 'primer_token_s', 'total_s', 'tokens' y 'tokens_s' del turno.
+        """
+        started = time.perf_counter()
+        first = None
+        parts = []
+        output_tokens = None
+        if self.echo:
+            print(f"{self.name}: ", end="", flush=True)
+        async for chunk in self.llm.astream(self.messages(message)):
+            if first is None:
+                first = time.perf_counter()
+            parts.append(chunk.content)
+            # Como al sumar `AIMessageChunk`, el uso de cada trozo se acumula.
+            if usage := getattr(chunk, "usage_metadata", None):
+                output_tokens = (output_tokens or 0) + usage.get("output_tokens", 0)
+            if self.echo:
+                print(chunk.content, end="", flush=True)
+        finished = time.perf_counter()
+        answer = "".join(parts)
+        if self.echo:
+            print()
+        self._append("human", message)
+        self._append("ai", answer)
+        self._trim()
+        # El servicio informa de los tokens generados; si no, se estiman.
+        tokens = output_tokens if output_tokens is not None else estimate_tokens(answer)
+        first = finished if first is None else first
+        generation = finished - first
+        stats = {
+            "primer_token_s": first - started,
+            "total_s": finished - started,
+            "tokens": tokens,
+            "tokens_s": tokens / generation if generation > 0 else 0.0,
+        }
+        self.turns.append(stats)
+        return stats
+
+
+class ChatEngine:
+    """
+    Muchas conversaciones a la vez en el mismo bucle de eventos, con un
+    límite de peticiones simultáneas al modelo.
+
+    Ejemplo:
+        engine = ChatEngine(llm, max_concurrency=8)
+        await engine.run_many([["Hola", "¿Qué tal?"], ["Cuéntame un chiste"]])
+        engine.report()
+    """
+
+    def __init__(self, llm, max_concurrency=8, max_history_tokens=2000):
+        """
+        Args:
+            llm (BaseChatModel): Modelo de LangChain con `astream`.
+            max_concurrency (int, opcional): Peticiones al modelo en curso como máximo. Por defecto 8.
+            max_history_tokens (int, opcional): Tokens de historial por conversación. Por defecto 2000.
+        """
+        self.llm = llm
+        self.max_history_tokens = max_history_tokens
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.conversations = []
+
+    def new_conversation(self, echo=False):
+        conversation = Conversation(self.llm, max_history_tokens=self.max_history_tokens,
+                                    name=f"Gemini[{len(self.conversations)}]", echo=echo)
+        self.conversations.append(conversation)
+        return conversation
+
+    async def ask(self, conversation, message):
+        """`Conversation.ask` respetando el límite de peticiones simultáneas."""
+        async with self.semaphore:
+            return await conversation.ask(message)
+
+    async def run_conversation(self, messages, echo=False):
+        conversation = self.new_conversation(echo=echo)
+        for message in messages:
+            await self.ask(conversation, message)
+        return conversation
+
+    async def run_many(self, scripts):
+        """
+        Ejecuta varias conversaciones en paralelo; cada una envía sus preguntas en orden.
+
+        Args:
+            scripts (List[List[str]]): Preguntas de cada conversación.
+
+        Returns:
+            List[Conversation]: Las conversaciones con sus medidas por turno.
+        """
+        return await asyncio.gather(*(self.run_conversation(messages) for messages in scripts))
+
+    def report(self, label="chat"):
+        """Muestra el tiempo hasta el primer token y los tokens/s de todos los turnos."""
+        turns = [turn for conversation in self.conversations for turn in conversation.turns]
+        if not turns:
+            return
+        ttft = sorted(turn["primer_token_s"] for turn in turns)
+        rate = sum(turn["tokens_s"] for turn in turns) / len(turns)
+        print(
+            f"\n[{label}] conversaciones={len(self.conversations)} turnos={len(turns)} "
+            f"primer token p50={1000 * ttft[len(ttft) // 2]:.0f} ms p95={1000 * ttft[int(0.95 * (len(ttft) - 1))]:.0f} ms "
+            f"tokens/s medio={rate:.1f}"
+        )
+
+
+def print_turn(stats):
+    print(f"  [primer token {1000 * stats['primer_token_s']:.0f} ms | {stats['tokens']} tokens "
+          f"| {stats['tokens_s']:.1f} tokens/s]")
+
+
+async def main(max_history_tokens=2000):
+    # `input` se ejecuta en un hilo para no bloquear el bucle de eventos.
+    conversation = Conversation(llm, max_history_tokens=max_history_tokens)
     while True:
-        message = input("\nHablame--> ")
+        message = await asyncio.to_thread(input, "\nHablame--> ")
         if message.lower() == "exit":
             break
-        
-        messages = [
-            ("system", "Eres un asistente que ayuda a los usuarios en Español."),
-            ("human", message)
-        ]
-        response = llm.invoke(messages)
-        print(f"Gemini: {response.content}")
+        print_turn(await conversation.ask(message))
+
+
+async def load_test(conversations, questions, max_concurrency, max_history_tokens=2000):
+    engine = ChatEngine(llm, max_concurrency=max_concurrency, max_history_tokens=max_history_tokens)
+    started = time.perf_counter()
+    await engine.run_many([questions] * conversations)
+    print(f"\n{conversations} conversaciones en {time.perf_counter() - started:.2f} s")
+    engine.report()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--historial", type=int, default=2000, metavar="TOKENS",
+                        help="Tokens máximos del historial de cada conversación")
+    parser.add_argument("--conversaciones", type=int, default=0, metavar="N",
+                        help="Lanza N conversaciones simultáneas con las preguntas de --preguntas")
+    parser.add_argument("--preguntas", nargs="+", default=["Hola, ¿quién eres?", "Resume lo anterior en una frase."],
+                        help="Preguntas de cada conversación en modo --conversaciones")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Peticiones simultáneas al modelo")
+    args = parser.parse_args()
+    if args.conversaciones:
+        asyncio.run(load_test(args.conversaciones, args.preguntas, args.concurrencia, args.historial))
+    else:
+        asyncio.run(main(args.historial))
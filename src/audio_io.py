@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import pyaudio
+
+try:
+    import psutil
+except ImportError:  # Sólo se usa para contar cambios de contexto.
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # No existe en Windows.
+    resource = None
+
+# Estado que PortAudio pasa al callback de entrada cuando se han perdido muestras.
+INPUT_OVERFLOW = getattr(pyaudio, "paInputOverflow", 2)
+
+
+def context_switches():
+    """
+    Cambios de contexto (voluntarios + involuntarios) del proceso hasta ahora.
+
+    Returns:
+        int | None: Total, o None si no se puede medir en este sistema.
+    """
+    if psutil is not None:
+        switches = psutil.Process().num_ctx_switches()
+        return switches.voluntary + switches.involuntary
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_nvcsw + usage.ru_nivcsw
+    return None
+
+
+class AudioIOStats:
+    """Contadores del backend de audio: saltos entre hilos, pérdidas y latencias."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.switches_start = context_switches()
+        self.hops = 0
+        self.mic_overflows = 0
+        self.mic_dropped = 0
+        self.hop_latency = []
+        self.output_latency = []
+
+    def report(self, label="audio"):
+        """Muestra saltos por segundo, cambios de contexto y latencias medias."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        switches = context_switches()
+        switches = "?" if switches is None or self.switches_start is None else \
+            f"{(switches - self.switches_start) / elapsed:.0f}/s"
+        mean = lambda values: 1000 * sum(values) / len(values) if values else 0.0
+        print(
+            f"\n[{label}] saltos al bucle={self.hops / elapsed:.1f}/s cambios de contexto={switches} "
+            f"latencia micro->bucle={mean(self.hop_latency):.2f} ms "
+            f"latencia llegada->altavoz={mean(self.output_latency):.1f} ms "
+            f"overflows={self.mic_overflows} descartados={self.mic_dropped}"
+        )
+
+
+class CallbackMicrophone:
+    """
+    Micrófono en modo callback: PortAudio entrega cada trozo en su propio
+    hilo y se pasa al bucle de eventos con `loop.call_soon_threadsafe`, sin
+    un `asyncio.to_thread` por lectura.
+    """
+
+    def __init__(self, pya, loop, rate, chunk_size, stats, input_device_index=None, maxsize=32):
+        """
+        Args:
+            pya (pyaudio.PyAudio): Instancia de PyAudio.
+            loop (asyncio.AbstractEventLoop): Bucle al que se entregan los trozos.
+            rate (int): Frecuencia de muestreo en Hz.
+            chunk_size (int): Muestras por trozo.
+            stats (AudioIOStats): Contadores compartidos.
+            input_device_index (int, opcional): Dispositivo de entrada.
+            maxsize (int, opcional): Trozos pendientes de leer; si se llena se descarta el más antiguo.
+        """
+        self.loop = loop
+        self.stats = stats
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.stream = pya.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=rate,
+            input=True,
+            input_device_index=input_device_index,
+            frames_per_buffer=chunk_size,
+            stream_callback=self._callback,
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # Hilo de PortAudio: sólo se programa la entrega en el bucle.
+        self.loop.call_soon_threadsafe(self._deliver, in_data, status, time.perf_counter())
+        return None, pyaudio.paContinue
+
+    def _deliver(self, data, status, captured):
+        self.stats.hops += 1
+        self.stats.hop_latency.append(time.perf_counter() - captured)
+        if status & INPUT_OVERFLOW:
+            self.stats.mic_overflows += 1
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.stats.mic_dropped += 1
+        self.queue.put_nowait(data)
+
+    async def read(self):
+        """Siguiente trozo del micrófono."""
+        return await self.queue.get()
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+
+
+class CallbackSpeaker:
+    """
+    Altavoz en modo callback: PortAudio pide cada periodo desde su hilo y se
+    saca directamente del `PcmRingBuffer`; si no hay audio listo se entrega
+    silencio. El bucle de eventos no interviene en la reproducción.
+    """
+
+    def __init__(self, pya, playback, rate, stats):
+        """
+        Args:
+            pya (pyaudio.PyAudio): Instancia de PyAudio.
+            playback (PcmRingBuffer): Búfer de reproducción; su periodo fija el tamaño de cada callback.
+            rate (int): Frecuencia de muestreo en Hz.
+            stats (AudioIOStats): Contadores compartidos.
+        """
+        self.playback = playback
+        self.stats = stats
+        self.silence = bytes(playback.period_bytes)
+        self.stream = pya.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=rate,
+            output=True,
+            frames_per_buffer=playback.period_bytes // playback.sample_width,
+            stream_callback=self._callback,
+        )
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        period = self.playback.poll_period()
+        if period is None:
+            return self.silence, pyaudio.paContinue
+        if (arrived := self.playback.pop_arrival()) is not None:
+            self.stats.output_latency.append(time.perf_counter() - arrived)
+        return period, pyaudio.paContinue
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
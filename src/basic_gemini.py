@@ -1,4 +1,9 @@
+import argparse
 import asyncio
+import sys
+import time
+from collections import deque
+
 from google import genai
 from dotenv import load_dotenv
 import os
@@ -9,23 +14,176 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 
-client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
-model_id = "gemini-2.0-flash-exp" 
+# El cliente se crea al usarlo (ver `get_client`), así el banco de pruebas con la API
+# simulada importa este módulo sin credenciales.
+client = None
+model_id = "gemini-2.0-flash-exp"
 config = {"response_modalities": ["TEXT"]}
 
-async def main():
-    async with client.aio.live.connect(model=model_id, config=config) as session:
-        while True:
-            message = input("User> ")
-            if message.lower() == "exit":
-                break           
-            
-            await session.send(input=message, end_of_turn=True)
 
-            async for response in session.receive():
+def get_client():
+    """Cliente de la API del módulo; se crea la primera vez que se pide."""
+    global client
+    if client is None:
+        client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+    return client
+
+
+class PromptPipeline:
+    """
+    Envía preguntas a una sesión Live abierta sin esperar a leer la siguiente:
+    las preguntas entran por `put` desde otra tarea, se envían mientras haya
+    menos de `max_in_flight` turnos sin terminar y cada turno que devuelve
+    `session.receive()` se asigna a la pregunta más antigua pendiente (la
+    sesión responde en orden). Se mide la latencia de cada pregunta y el
+    rendimiento total.
+
+    Con la API Live real, una pregunta nueva interrumpe la respuesta en curso,
+    por eso por defecto sólo hay un turno en vuelo; la cola de entrada sigue
+    llenándose en segundo plano y la siguiente pregunta sale en cuanto termina
+    el turno.
+
+    Ejemplo:
+        pipeline = PromptPipeline(session)
+        tg.create_task(pipeline.run())
+        await pipeline.put("Hola")
+        await pipeline.put(None)  # fin
+    """
+
+    def __init__(self, session, max_in_flight=1, echo=True):
+        """
+        Args:
+            session: Sesión Live abierta (`client.aio.live.connect`).
+            max_in_flight (int, opcional): Turnos enviados sin terminar como máximo. Por defecto 1.
+            echo (bool, opcional): Si se imprime el texto de las respuestas. Por defecto True.
+        """
+        self.session = session
+        self.max_in_flight = max_in_flight
+        self.echo = echo
+        self.prompts = asyncio.Queue()
+        self.in_flight = deque()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.results = []
+        self.started = None
+        self.finished = None
+
+    async def put(self, prompt):
+        """Encola una pregunta; None indica que no habrá más."""
+        if prompt is not None:
+            self.idle.clear()
+        await self.prompts.put(prompt)
+
+    async def send_prompts(self):
+        while (prompt := await self.prompts.get()) is not None:
+            await self.slots.acquire()
+            sent = time.perf_counter()
+            if self.started is None:
+                self.started = sent
+            self.in_flight.append({"pregunta": prompt, "enviada": sent, "primer_texto": None, "caracteres": 0})
+            await self.session.send(input=prompt, end_of_turn=True)
+        # Se espera a que terminen los turnos en vuelo.
+        for _ in range(self.max_in_flight):
+            await self.slots.acquire()
+
+    async def receive_responses(self):
+        while True:
+            async for response in self.session.receive():
                 if response.text is None:
                     continue
-                print(response.text, end="")
+                current = self.in_flight[0]
+                if current["primer_texto"] is None:
+                    current["primer_texto"] = time.perf_counter()
+                current["caracteres"] += len(response.text)
+                if self.echo:
+                    print(response.text, end="")
+            if not self.in_flight:
+                continue
+            current = self.in_flight.popleft()
+            current["completa"] = self.finished = time.perf_counter()
+            self.results.append(current)
+            if self.echo:
+                print()
+            if not self.in_flight and self.prompts.empty():
+                self.idle.set()
+            self.slots.release()
+
+    async def run(self):
+        """
+        Envía y recibe hasta que se encola None y terminan todas las respuestas.
+        Si la recepción falla, se cancela el envío (que esperaría para siempre a
+        que se liberen los turnos en vuelo) y se lanza el error de la recepción.
+        """
+        receiver = asyncio.create_task(self.receive_responses())
+        sender = asyncio.create_task(self.send_prompts())
+        try:
+            await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            receiver.cancel()
+            sender.cancel()
+        if sender.done() and not sender.cancelled():
+            sender.result()
+            return
+        receiver.result()
+
+    def report(self, label="preguntas"):
+        """Muestra la latencia por pregunta y el rendimiento total."""
+        if not self.results:
+            return
+        print(f"\n[{label}]")
+        for n, result in enumerate(self.results, 1):
+            first = result["primer_texto"] or result["completa"]
+            print(f"  {n:>3} primer texto={1000 * (first - result['enviada']):7.0f} ms "
+                  f"total={1000 * (result['completa'] - result['enviada']):7.0f} ms  {result['pregunta'][:40]!r}")
+        elapsed = max(self.finished - self.started, 1e-9)
+        chars = sum(result["caracteres"] for result in self.results)
+        print(f"  {len(self.results)} preguntas en {elapsed:.2f} s: {len(self.results) / elapsed:.2f} preguntas/s, "
+              f"{chars / elapsed:.0f} caracteres/s (en vuelo máx={self.max_in_flight})")
+
+
+async def read_prompts(pipeline, path=None):
+    """
+    Lee preguntas de un fichero (una por línea) o de la entrada estándar, en
+    segundo plano, y las encola en `pipeline`. "exit" o el fin de la entrada terminan.
+    """
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    await pipeline.put(line.strip())
+        await pipeline.put(None)
+        return
+    interactive = sys.stdin.isatty()
+    while True:
+        if interactive:
+            # En una terminal se espera a la respuesta para no mezclar el texto con el prompt.
+            await pipeline.idle.wait()
+        try:
+            # `input` se ejecuta en un hilo para no bloquear el bucle de eventos.
+            message = await asyncio.to_thread(input, "User> ")
+        except EOFError:
+            message = "exit"
+        if message.lower() == "exit":
+            break
+        await pipeline.put(message)
+    await pipeline.put(None)
+
+
+async def main(path=None, max_in_flight=1):
+    async with get_client().aio.live.connect(model=model_id, config=config) as session:
+        pipeline = PromptPipeline(session, max_in_flight=max_in_flight)
+        reader = asyncio.create_task(read_prompts(pipeline, path))
+        try:
+            await pipeline.run()
+        finally:
+            reader.cancel()
+        pipeline.report()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fichero", default=None, help="Lee las preguntas de un fichero, una por línea")
+    parser.add_argument("--en-vuelo", type=int, default=1, metavar="N",
+                        help="Turnos enviados sin esperar respuesta (la API Live real interrumpe con más de 1)")
+    args = parser.parse_args()
+    asyncio.run(main(args.fichero, args.en_vuelo))
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from live_mock import RECEIVE_SAMPLE_RATE, MockClient, MockPyAudio
+
+# Métricas que se comparan con la línea base: sólo cuentan si empeoran en más de
+# `tolerance` (relativa) y además en más de este margen absoluto.
+LATENCY_MARGIN = 0.005  # s
+CPU_MARGIN = 1.0        # ms
+
+
+def percentile(values, q):
+    """Valor del percentil `q` (0-100) de `values`; 0 si está vacía."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+@contextlib.contextmanager
+def patched(module, **attributes):
+    """Sustituye atributos de un módulo (p. ej. `client` o `input`) y los restaura al salir."""
+    missing = object()
+    previous = {name: getattr(module, name, missing) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is missing:
+                delattr(module, name)
+            else:
+                setattr(module, name, value)
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Cambia el directorio de trabajo y lo restaura al salir (`contextlib.chdir` sólo existe desde 3.11)."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def scripted_input(prompts):
+    """Sustituto de `input()` que devuelve `prompts` en orden y después "exit"."""
+    answers = iter(list(prompts) + ["exit"])
+    return lambda prompt="": next(answers)
+
+
+async def bench_basic(turns, mock):
+    """Conversación de texto de basic_gemini.main."""
+    import basic_gemini
+
+    with patched(basic_gemini, client=mock, input=scripted_input(f"pregunta {i}" for i in range(turns))):
+        await basic_gemini.main()
+    return [(t.user_end, t.first_chunk, t.complete) for t in mock.sessions[0].timings]
+
+
+async def bench_text_to_audio(turns, mock):
+    """Preguntas de texto con respuesta en audio de text_to_audio_gemini.main (en una carpeta temporal)."""
+    import text_to_audio_gemini
+
+    with tempfile.TemporaryDirectory() as folder, working_directory(folder):
+        os.mkdir("audios")
+        with patched(text_to_audio_gemini, client=mock,
+                     input=scripted_input(f"pregunta {i}" for i in range(turns))):
+            await text_to_audio_gemini.main()
+    return [(t.user_end, t.first_chunk, t.complete) for t in mock.sessions[0].timings]
+
+
+async def bench_voice(turns, mock, timeout=60):
+    """
+    `AudioLoop` con micrófono y altavoz simulados: el primer audio de cada turno
+    es la primera escritura en el altavoz, no la llegada del trozo.
+    """
+    import voice_to_voice_gemini
+
+    pya = MockPyAudio()
+    with patched(voice_to_voice_gemini, pya=pya):
+        # El micrófono simulado es un tono continuo: sin desactivar la interrupción cortaría cada respuesta.
+        loop = voice_to_voice_gemini.AudioLoop(client=mock, barge_in=False)
+        task = asyncio.create_task(loop.run())
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            timings = mock.sessions[0].timings if mock.sessions else []
+            if len(timings) >= turns and timings[turns - 1].complete is not None:
+                break
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)  # deja terminar la reproducción del último trozo
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    results = []
+    for timing in mock.sessions[0].timings[:turns]:
+        heard = next((at for at, _ in pya.writes if timing.first_chunk is not None and at >= timing.first_chunk), None)
+        results.append((timing.user_end, heard, timing.complete))
+    return results
+
+
+SCENARIOS = {
+    "basic": bench_basic,
+    "texto_audio": bench_text_to_audio,
+    "voz": bench_voice,
+}
+
+
+async def run_scenario(name, turns, mock_options):
+    """
+    Ejecuta un escenario contra la API simulada y resume sus métricas.
+
+    Args:
+        name (str): Escenario de `SCENARIOS`.
+        turns (int): Turnos que se miden.
+        mock_options (dict): Parámetros de `MockSession` (retardos, jitter...).
+
+    Returns:
+        dict: Percentiles (s) del primer audio/token y del turno completo, CPU por
+        turno y por segundo de audio (ms) y mensajes enviados por segundo.
+    """
+    mock = MockClient(**mock_options)
+    wall, cpu = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = await SCENARIOS[name](turns, mock)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    session = mock.sessions[0]
+    first = [first - start for start, first, _ in timings if first is not None]
+    total = [end - start for start, _, end in timings if end is not None]
+    audio_seconds = sum(t.audio_bytes for t in session.timings) / 2 / RECEIVE_SAMPLE_RATE
+    summary = {"turnos": len(total)}
+    for label, values in (("primer_audio", first), ("turno", total)):
+        for q in (50, 95, 99):
+            summary[f"{label}_p{q}_s"] = round(percentile(values, q), 4)
+    summary["cpu_ms_por_turno"] = round(1000 * cpu / max(len(total), 1), 2)
+    if audio_seconds:
+        summary["cpu_ms_por_s_audio"] = round(1000 * cpu / audio_seconds, 2)
+    summary["envios_por_s"] = round(session.messages / wall, 1)
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """
+    Busca regresiones frente a una línea base.
+
+    Args:
+        results (dict): Resultados actuales por escenario.
+        baseline (dict): Resultados guardados con `--guardar-base`.
+        tolerance (float): Empeoramiento relativo permitido (0.2 = 20 %).
+
+    Returns:
+        List[str]: Una descripción por métrica que ha empeorado.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            base = baseline.get(name, {}).get(key)
+            if base is None or not (key.endswith("_s") or key.startswith("cpu_")):
+                continue
+            margin = CPU_MARGIN if key.startswith("cpu_") else LATENCY_MARGIN
+            if value > base * (1 + tolerance) + margin:
+                regressions.append(f"{name}.{key}: {base} -> {value}")
+    return regressions
+
+
+async def main(args):
+    mock_options = {
+        "first_chunk_delay": args.retardo,
+        "chunk_interval": args.intervalo,
+        "send_delay": args.envio,
+        "jitter": args.jitter,
+        "response_seconds": args.respuesta,
+    }
+    results = {}
+    for name in args.escenarios:
+        results[name] = await run_scenario(name, args.turnos, mock_options)
+        print(f"\n[{name}]")
+        for key, value in results[name].items():
+            print(f"  {key:<22} {value}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latencias de extremo a extremo contra una API Live simulada")
+    parser.add_argument("--escenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--turnos", type=int, default=10)
+    parser.add_argument("--retardo", type=float, default=0.2, help="Segundos hasta el primer trozo de respuesta")
+    parser.add_argument("--intervalo", type=float, default=0.02, help="Segundos entre trozos de respuesta")
+    parser.add_argument("--envio", type=float, default=0.0, help="Segundos que tarda cada envío")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Retardo aleatorio máximo por espera")
+    parser.add_argument("--respuesta", type=float, default=1.0, help="Segundos de audio de cada respuesta")
+    parser.add_argument("--base", help="JSON con la línea base (p. ej. benchmark_base.json); termina con error "
+                                       "si hay regresiones")
+    parser.add_argument("--guardar-base", help="Guarda los resultados como nueva línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo permitido")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.guardar_base:
+        with open(args.guardar_base, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    if args.base:
+        with open(args.base, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerancia)
+        if regressions:
+            print("\nRegresiones:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("\nSin regresiones respecto a la línea base.")
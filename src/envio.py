@@ -0,0 +1,161 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from trazas import NULL_TRACER
+from vad import level_db
+
+POLICIES = ("drop-oldest", "drop-silence-first", "block")
+
+
+class SendPipeline:
+    """
+    Cola de envío del micrófono a la sesión Live. Cuando el envío se retrasa,
+    junta varios trozos consecutivos en un solo mensaje: el tamaño objetivo
+    de cada mensaje es el tiempo de ida y vuelta medido de `send` dividido
+    por la duración de un trozo, y nunca se envía menos de lo que haya
+    acumulado en la cola (hasta `max_frame_chunks`). Si la cola se llena
+    aplica la política indicada:
+
+    - "drop-oldest": descarta el trozo más antiguo; el micrófono nunca espera.
+    - "drop-silence-first": descarta el silencio más antiguo y, si no hay, el trozo más antiguo.
+    - "block": el micrófono espera a que haya hueco (comportamiento original de `out_queue`).
+
+    Cada decisión se cuenta en `counters`.
+
+    Ejemplo:
+        sender = SendPipeline(session.send)
+        tg.create_task(sender.run())
+        await sender.put(data)
+    """
+
+    def __init__(self, send, maxsize=5, policy="drop-silence-first", max_frame_chunks=4,
+                 chunk_seconds=1024 / 16000, max_wait=None, silence_db=-50.0, rtt_smoothing=0.2,
+                 tracer=NULL_TRACER):
+        """
+        Args:
+            send (Callable[..., Awaitable]): Función de envío, p. ej. `session.send`; recibe `input=`.
+            maxsize (int, opcional): Trozos pendientes como máximo. Por defecto 5.
+            policy (str, opcional): Política si la cola está llena (ver `POLICIES`).
+                Por defecto "drop-silence-first".
+            max_frame_chunks (int, opcional): Trozos máximos por mensaje. 1 desactiva la agrupación.
+                Por defecto 4.
+            chunk_seconds (float, opcional): Duración de un trozo. Por defecto 1024 muestras a 16 kHz.
+            max_wait (float, opcional): Espera máxima para completar un mensaje agrupado. Por defecto
+                la duración de un trozo.
+            silence_db (float, opcional): Nivel (dBFS) por debajo del cual un trozo cuenta como
+                silencio para "drop-silence-first". Por defecto -50.
+            rtt_smoothing (float, opcional): Peso de cada medida en la media móvil del tiempo de envío.
+            tracer (trazas.Tracer, opcional): Instrumentación; por defecto ninguna.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconocida: {policy!r}. Opciones: {', '.join(POLICIES)}")
+        self.send = send
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_frame_chunks = max(1, max_frame_chunks)
+        self.chunk_seconds = chunk_seconds
+        self.max_wait = chunk_seconds if max_wait is None else max_wait
+        self.silence_db = silence_db
+        self.rtt_smoothing = rtt_smoothing
+        self.tracer = tracer
+        self.rtt = 0.0
+        self.counters = {
+            "trozos": 0,
+            "mensajes": 0,
+            "agrupados": 0,
+            "descartados_antiguos": 0,
+            "descartados_silencio": 0,
+            "bloqueos": 0,
+        }
+        self.blocked_time = 0.0
+        self._chunks = deque()
+        self._changed = asyncio.Condition()
+
+    def qsize(self):
+        return len(self._chunks)
+
+    def full(self):
+        return len(self._chunks) >= self.maxsize
+
+    def target_chunks(self):
+        """Trozos por mensaje para que los envíos sigan el ritmo del micrófono con el RTT medido."""
+        return max(1, min(self.max_frame_chunks, math.ceil(self.rtt / self.chunk_seconds)))
+
+    def _drop(self):
+        """Libera un hueco según la política "drop-*"."""
+        if self.policy == "drop-silence-first":
+            for i, (_, silent, _) in enumerate(self._chunks):
+                if silent:
+                    del self._chunks[i]
+                    self.counters["descartados_silencio"] += 1
+                    return
+        self._chunks.popleft()
+        self.counters["descartados_antiguos"] += 1
+
+    async def put(self, chunk):
+        """
+        Encola un trozo del micrófono. Sólo espera con la política "block".
+
+        Args:
+            chunk (bytes): Trozo PCM int16.
+        """
+        async with self._changed:
+            if self.full():
+                if self.policy == "block":
+                    self.counters["bloqueos"] += 1
+                    started = time.perf_counter()
+                    await self._changed.wait_for(lambda: not self.full())
+                    self.blocked_time += time.perf_counter() - started
+                else:
+                    self._drop()
+            silent = self.policy == "drop-silence-first" and level_db(chunk) < self.silence_db
+            # Cada trozo lleva su instante de entrada: así un descarte no descuadra la espera de los demás.
+            self._chunks.append((chunk, silent, time.perf_counter()))
+            self.counters["trozos"] += 1
+            self.tracer.gauge("out_queue", len(self._chunks))
+            self._changed.notify_all()
+
+    async def _next_frame(self):
+        """Espera a tener trozos y devuelve los que forman el siguiente mensaje."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._chunks)
+            target = self.target_chunks()
+            if len(self._chunks) < target:
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: len(self._chunks) >= target),
+                                           self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            frame = []
+            now = time.perf_counter()
+            while self._chunks and len(frame) < self.max_frame_chunks:
+                chunk, _, enqueued = self._chunks.popleft()
+                frame.append(chunk)
+                self.tracer.observe("espera_envio", now - enqueued)
+            self.tracer.gauge("out_queue", len(self._chunks))
+            self._changed.notify_all()
+            return frame
+
+    async def run(self):
+        """Bucle de envío; se ejecuta hasta que se cancela la tarea."""
+        while True:
+            frame = await self._next_frame()
+            started = time.perf_counter()
+            await self.send(input={"data": b"".join(frame), "mime_type": "audio/pcm"})
+            elapsed = time.perf_counter() - started
+            self.rtt += self.rtt_smoothing * (elapsed - self.rtt)
+            self.tracer.observe("enviar", elapsed)
+            self.counters["mensajes"] += 1
+            self.counters["agrupados"] += len(frame) > 1
+
+    def report(self, label="envío"):
+        """Muestra los mensajes enviados y cada decisión tomada."""
+        c = self.counters
+        print(
+            f"\n[{label}] política={self.policy} trozos={c['trozos']} mensajes={c['mensajes']} "
+            f"(agrupados={c['agrupados']}) descartados: antiguos={c['descartados_antiguos']} "
+            f"silencio={c['descartados_silencio']} bloqueos={c['bloqueos']} ({self.blocked_time:.2f} s) "
+            f"rtt={1000 * self.rtt:.1f} ms"
+        )
@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+
+import numpy as np
+
+SEND_SAMPLE_RATE = 16000
+RECEIVE_SAMPLE_RATE = 24000
+
+
+def synthetic_pcm(seconds, rate=RECEIVE_SAMPLE_RATE, frequency=220.0, amplitude=0.3):
+    """
+    Genera un tono PCM de 16 bits mono para simular voz.
+
+    Args:
+        seconds (float): Duración del audio.
+        rate (int, opcional): Frecuencia de muestreo en Hz. Por defecto 24000.
+        frequency (float, opcional): Frecuencia del tono en Hz. Por defecto 220.
+        amplitude (float, opcional): Amplitud entre 0 y 1. Por defecto 0.3.
+
+    Returns:
+        bytes: Muestras int16 little-endian.
+    """
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * 32767 * np.sin(2 * np.pi * frequency * t)).astype('<i2').tobytes()
+
+
+class _Namespace:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class MockResponse:
+    """Respuesta con los mismos atributos que usan los scripts: `data`, `text` y `server_content`."""
+
+    def __init__(self, data=None, text=None, turn_complete=False, mime_type=f"audio/pcm;rate={RECEIVE_SAMPLE_RATE}"):
+        self.data = data
+        self.text = text
+        inline_data = _Namespace(mime_type=mime_type) if data is not None else None
+        self.server_content = _Namespace(
+            model_turn=_Namespace(parts=[_Namespace(inline_data=inline_data, text=text)]),
+            turn_complete=turn_complete,
+        )
+
+
+class TurnTiming:
+    """Instantes (`time.perf_counter()`) de un turno simulado."""
+
+    __slots__ = ('prompt', 'user_end', 'first_chunk', 'complete', 'audio_bytes')
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.user_end = time.perf_counter()
+        self.first_chunk = None
+        self.complete = None
+        self.audio_bytes = 0
+
+
+class MockSession:
+    """
+    Sesión falsa de la API Live. Cada pregunta de texto (o cada `turn_seconds`
+    de audio recibido) abre un turno que responde con un tono de
+    `response_seconds` en trozos de `chunk_bytes`, o con texto si la
+    configuración pide la modalidad "TEXT". Los retardos simulan el tiempo
+    que tarda el modelo en empezar a responder y la red entre trozos; los
+    instantes de cada turno quedan en `timings`.
+    """
+
+    def __init__(self, config=None, response_seconds=1.0, chunk_bytes=4800, turn_seconds=1.0,
+                 first_chunk_delay=0.0, chunk_interval=0.0, send_delay=0.0, jitter=0.0, failure_rate=0.0, seed=0):
+        """
+        Args:
+            config (dict, opcional): Configuración pasada a `connect`.
+            response_seconds (float, opcional): Duración del audio de cada respuesta. Por defecto 1.
+            chunk_bytes (int, opcional): Tamaño de cada trozo de audio de la respuesta. Por defecto 4800 (100 ms).
+            turn_seconds (float, opcional): Segundos de audio del usuario que cierran un turno. Por defecto 1.
+            first_chunk_delay (float, opcional): Segundos desde el fin del turno del usuario hasta el
+                primer trozo de la respuesta. Por defecto 0.
+            chunk_interval (float, opcional): Segundos entre trozos de la respuesta. Por defecto 0.
+            send_delay (float, opcional): Segundos que tarda cada `send`. Por defecto 0.
+            jitter (float, opcional): Retardo aleatorio máximo que se suma a cada espera. Por defecto 0.
+            failure_rate (float, opcional): Probabilidad de que la conexión se corte a mitad de una
+                respuesta (lanza `ConnectionError`), para probar reintentos. Por defecto 0.
+            seed (int, opcional): Semilla del jitter para que las pruebas sean reproducibles.
+        """
+        config = config or {}
+        modalities = config.get("response_modalities") or config.get("generation_config", {}).get(
+            "response_modalities", ["AUDIO"])
+        self.text_only = "TEXT" in modalities
+        self.response_audio = synthetic_pcm(response_seconds)
+        self.chunk_bytes = chunk_bytes
+        self.turn_bytes = int(turn_seconds * SEND_SAMPLE_RATE) * 2
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_interval = chunk_interval
+        self.send_delay = send_delay
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.messages = 0
+        self.bytes_received = 0
+        self.timings = []
+        self._random = random.Random(seed)
+        self._pending_audio = 0
+        self._turns = asyncio.Queue()
+
+    async def _wait(self, seconds):
+        seconds += self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def _open_turn(self, prompt):
+        timing = TurnTiming(prompt)
+        self.timings.append(timing)
+        self._turns.put_nowait(timing)
+
+    async def send(self, input=None, end_of_turn=False):
+        """Recibe texto o un trozo de audio ({"data": ..., "mime_type": ...}) como la sesión real."""
+        await self._wait(self.send_delay)
+        self.messages += 1
+        if isinstance(input, dict):
+            self.bytes_received += len(input["data"])
+            self._pending_audio += len(input["data"])
+            while self._pending_audio >= self.turn_bytes:
+                self._pending_audio -= self.turn_bytes
+                self._open_turn("audio")
+        elif input is not None:
+            self._open_turn(str(input))
+        elif end_of_turn:
+            self._open_turn("")
+
+    async def receive(self):
+        """Espera al siguiente turno y devuelve sus respuestas hasta `turn_complete`."""
+        timing = await self._turns.get()
+        await self._wait(max(0.0, timing.user_end + self.first_chunk_delay - time.perf_counter()))
+        if self.text_only:
+            pieces = [MockResponse(text=word + " ") for word in f"Respuesta simulada a: {timing.prompt}".split()]
+        else:
+            audio = memoryview(self.response_audio)
+            pieces = [MockResponse(data=bytes(audio[start:start + self.chunk_bytes]))
+                      for start in range(0, len(audio), self.chunk_bytes)]
+        for i, piece in enumerate(pieces):
+            if i:
+                await self._wait(self.chunk_interval)
+            else:
+                timing.first_chunk = time.perf_counter()
+            timing.audio_bytes += len(piece.data or b"")
+            yield piece
+            if i == len(pieces) // 2 and self.failure_rate and self._random.random() < self.failure_rate:
+                raise ConnectionError("Conexión cortada (simulada)")
+        timing.complete = time.perf_counter()
+        yield MockResponse(turn_complete=True)
+
+
+class _MockLive:
+    def __init__(self, client):
+        self._client = client
+
+    @contextlib.asynccontextmanager
+    async def connect(self, model=None, config=None):
+        # Cada sesión tiene su propia semilla para que los fallos y el jitter no se repitan igual.
+        options = dict(self._client.session_options)
+        options["seed"] = options.get("seed", 0) + len(self._client.sessions)
+        session = MockSession(config=config, **options)
+        self._client.sessions.append(session)
+        yield session
+
+
+class MockClient:
+    """
+    Sustituto local de `genai.Client` para probar los bucles sin red:
+    `client.aio.live.connect(model=..., config=...)` devuelve una `MockSession`.
+
+    Ejemplo:
+        loop = AudioLoop(client=MockClient(response_seconds=2))
+    """
+
+    def __init__(self, **session_options):
+        """
+        Args:
+            **session_options: Parámetros de `MockSession` para cada conexión.
+        """
+        self.session_options = session_options
+        self.sessions = []
+        self.aio = _Namespace(live=_MockLive(self))
+
+
+class MockInputStream:
+    """Micrófono simulado: `read` entrega el PCM indicado en bucle al ritmo real del audio."""
+
+    def __init__(self, pcm, rate):
+        self.pcm = pcm
+        self.rate = rate
+        self.position = 0
+        self.started = time.perf_counter()
+        self.frames_read = 0
+
+    def read(self, frames, exception_on_overflow=True):
+        self.frames_read += frames
+        time.sleep(max(0.0, self.started + self.frames_read / self.rate - time.perf_counter()))
+        chunk = bytearray()
+        while len(chunk) < frames * 2:
+            take = min(frames * 2 - len(chunk), len(self.pcm) - self.position)
+            chunk += self.pcm[self.position:self.position + take]
+            self.position = (self.position + take) % len(self.pcm)
+        return bytes(chunk)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockOutputStream:
+    """Altavoz simulado: `write` tarda lo que dura el audio y anota cuándo se escribió cada trozo."""
+
+    def __init__(self, rate, writes):
+        self.rate = rate
+        self.writes = writes
+
+    def write(self, data):
+        self.writes.append((time.perf_counter(), len(data)))
+        time.sleep(len(data) / 2 / self.rate)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockCallbackStream:
+    """
+    Stream en modo callback: un hilo propio llama a `callback` al ritmo real
+    del audio, como el hilo de PortAudio. En salida sólo se anotan en `writes`
+    los periodos con sonido.
+    """
+
+    def __init__(self, callback, frames, rate, pcm=None, writes=None):
+        self.callback = callback
+        self.frames = frames
+        self.rate = rate
+        self.input = MockInputStream(pcm, rate) if pcm is not None else None
+        self.writes = writes
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        periods = 0
+        while not self._stopped.is_set():
+            if self.input is not None:
+                self.callback(self.input.read(self.frames), self.frames, {}, 0)
+                continue
+            data, _ = self.callback(None, self.frames, {}, 0)
+            if bytes(data).strip(b"\0"):
+                self.writes.append((time.perf_counter(), len(data)))
+            periods += 1
+            time.sleep(max(0.0, started + periods * self.frames / self.rate - time.perf_counter()))
+
+    def stop_stream(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+class MockPyAudio:
+    """
+    Sustituto de `pyaudio.PyAudio` sin dispositivos reales, para medir
+    `AudioLoop` de principio a fin. Lo escrito en el altavoz queda en `writes`
+    como (instante, bytes).
+    """
+
+    def __init__(self, mic_pcm=None):
+        """
+        Args:
+            mic_pcm (bytes, opcional): Audio int16 a 16 kHz que devuelve el micrófono. Por defecto un tono.
+        """
+        self.mic_pcm = mic_pcm if mic_pcm is not None else synthetic_pcm(1.0, rate=SEND_SAMPLE_RATE)
+        self.writes = []
+
+    def get_default_input_device_info(self):
+        return {"index": 0}
+
+    def open(self, format=None, channels=1, rate=SEND_SAMPLE_RATE, input=False, output=False,
+             frames_per_buffer=1024, stream_callback=None, **kwargs):
+        if stream_callback is not None:
+            pcm = self.mic_pcm if input else None
+            return MockCallbackStream(stream_callback, frames_per_buffer, rate, pcm, self.writes)
+        if input:
+            return MockInputStream(self.mic_pcm, rate)
+        return MockOutputStream(rate, self.writes)
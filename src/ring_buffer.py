@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import time
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class PcmRingBuffer:
+    """
+    Búfer circular de PCM para la reproducción, con memoria fija: el audio
+    recibido se copia en un `bytearray` preasignado y el altavoz lo lee en
+    periodos de tamaño constante a través de un `memoryview`, sin crear un
+    objeto nuevo por trozo.
+
+    Hace de búfer de jitter: al empezar un turno (o tras vaciarse a mitad de
+    turno) no se reproduce nada hasta acumular `jitter_ms`, así la
+    reproducción no se corta cuando los trozos llegan a golpes. El modelo
+    envía el audio más rápido de lo que se reproduce: quien recibe espera a
+    que haya hueco con `wait_writable` antes de escribir, así la memoria
+    sigue acotada sin perder audio.
+
+    Ejemplo:
+        playback = PcmRingBuffer()
+        await playback.wait_writable(len(response.data))
+        playback.write(response.data)      # al recibir
+        await playback.wait_period()       # al reproducir
+        stream.write(playback.read_period())
+    """
+
+    def __init__(self, capacity_seconds=10.0, rate=24000, period_frames=1024, jitter_ms=120, sample_width=2):
+        """
+        Args:
+            capacity_seconds (float, opcional): Audio máximo almacenado. Por defecto 10 s.
+            rate (int, opcional): Frecuencia de muestreo en Hz. Por defecto 24000.
+            period_frames (int, opcional): Muestras por escritura en el altavoz. Por defecto 1024.
+            jitter_ms (float, opcional): Audio acumulado antes de empezar a reproducir. Por defecto 120 ms.
+            sample_width (int, opcional): Bytes por muestra. Por defecto 2.
+        """
+        self.rate = rate
+        self.sample_width = sample_width
+        self.period_bytes = period_frames * sample_width
+        periods = max(2, int(capacity_seconds * rate * sample_width) // self.period_bytes)
+        self.capacity = periods * self.period_bytes
+        self.jitter_bytes = min(self.capacity, int(jitter_ms / 1000 * rate) * sample_width)
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+        self._period = bytearray(self.period_bytes)
+        self._period_view = memoryview(self._period).toreadonly()
+        self._start = 0
+        self._size = 0
+        self.playing = False
+        self.ended = False
+        self.underruns = 0
+        self.overruns = 0
+        self.overrun_bytes = 0
+        self.max_buffered = 0
+        self._arrival = None
+        self._silence_since = None
+        self.silence_latency = []
+        self._lock = threading.Lock()
+        self._readable = asyncio.Event()
+        self._writer = None  # (bucle, futuro, bytes) de quien espera hueco en `wait_writable`
+
+    def __len__(self):
+        return self._size
+
+    def qsize(self):
+        """Periodos completos almacenados."""
+        return self._size // self.period_bytes
+
+    @property
+    def buffered_ms(self):
+        """Audio almacenado en milisegundos."""
+        return 1000 * self._size / self.sample_width / self.rate
+
+    @property
+    def readable(self):
+        """Si hay un periodo listo para reproducir."""
+        return (self.playing and self._size >= self.period_bytes) or (self.ended and self._size > 0)
+
+    def _update(self):
+        if self.readable:
+            self._readable.set()
+        else:
+            self._readable.clear()
+        # Se despierta a quien espera hueco; el altavoz puede leer desde el hilo de PortAudio.
+        if self._writer is not None and self.capacity - self._size >= self._writer[2]:
+            loop, waiter, _ = self._writer
+            self._writer = None
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    async def wait_writable(self, n):
+        """
+        Espera a que quepan `n` bytes sin descartar audio pendiente de reproducir. Sólo
+        puede esperar una tarea a la vez.
+
+        Args:
+            n (int): Bytes que se van a escribir (como mucho la capacidad del búfer).
+        """
+        n = min(n, self.capacity)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self.capacity - self._size >= n:
+                    return
+                waiter = loop.create_future()
+                self._writer = (loop, waiter, n)
+            await waiter
+
+    def write(self, data):
+        """
+        Copia audio en el búfer. Si no cabe (no se ha esperado con `wait_writable` o el trozo es
+        mayor que el búfer), descarta el más antiguo y lo cuenta como overrun.
+
+        Args:
+            data (bytes): PCM recibido.
+        """
+        data = memoryview(data).cast("B")
+        with self._lock:
+            if self._size == 0 and self._arrival is None:
+                self._arrival = time.perf_counter()
+            if len(data) > self.capacity:
+                self.overrun_bytes += len(data) - self.capacity
+                data = data[-self.capacity:]
+            excess = self._size + len(data) - self.capacity
+            if excess > 0:
+                self.overruns += 1
+                self.overrun_bytes += excess
+                self._start = (self._start + excess) % self.capacity
+                self._size -= excess
+            end = (self._start + self._size) % self.capacity
+            first = min(len(data), self.capacity - end)
+            self._view[end:end + first] = data[:first]
+            self._view[:len(data) - first] = data[first:]
+            self._size += len(data)
+            self.max_buffered = max(self.max_buffered, self._size)
+            self.ended = False
+            if not self.playing and self._size >= self.jitter_bytes:
+                self.playing = True
+            self._update()
+
+    def end_turn(self):
+        """Marca el fin de la respuesta: lo que quede se reproduce aunque no llegue al objetivo de jitter."""
+        with self._lock:
+            self.ended = self._size > 0
+            self._update()
+
+    def clear(self, since=None):
+        """
+        Descarta todo el audio pendiente (p. ej. al interrumpir la respuesta).
+
+        Args:
+            since (float, opcional): Instante (`time.perf_counter()`) desde el que se mide cuánto
+                tarda el altavoz en quedarse en silencio, p. ej. cuando se detectó la voz del
+                usuario. La medida se guarda en `silence_latency` cuando el altavoz pide el
+                siguiente periodo, es decir, al terminar el que estaba sonando.
+
+        Returns:
+            int: Bytes descartados.
+        """
+        with self._lock:
+            dropped, self._size, self._start = self._size, 0, 0
+            self.playing = self.ended = False
+            self._arrival = None
+            if since is not None:
+                self._silence_since = since
+            self._update()
+            return dropped
+
+    def _check_underrun(self):
+        """Quedarse sin audio a mitad de turno cuenta como underrun y vuelve a esperar el jitter."""
+        with self._lock:
+            if self.playing and not self.ended and not self.readable:
+                self.underruns += 1
+                self.playing = False
+            if self._silence_since is not None:
+                self.silence_latency.append(time.perf_counter() - self._silence_since)
+                self._silence_since = None
+            self._update()
+
+    async def wait_period(self):
+        """Espera (en el bucle de eventos) a que haya un periodo listo."""
+        while not self.readable:
+            self._check_underrun()
+            await self._readable.wait()
+
+    def poll_period(self):
+        """
+        Versión sin espera para el callback de PortAudio.
+
+        Returns:
+            memoryview | None: El siguiente periodo (ver `read_period`) o None si no hay ninguno listo.
+        """
+        if not self.readable:
+            self._check_underrun()
+            return None
+        return self.read_period()
+
+    def pop_arrival(self):
+        """
+        Instante en que llegó el primer audio tras estar vacío, sólo la primera vez que se pide;
+        sirve para medir cuánto tarda el audio en llegar al altavoz.
+        """
+        with self._lock:
+            arrival, self._arrival = self._arrival, None
+            return arrival
+
+    def read_period(self):
+        """
+        Saca un periodo del búfer. El último periodo de un turno se completa con silencio.
+
+        Returns:
+            memoryview: Vista de sólo lectura de `period_bytes` bytes; es válida hasta la siguiente lectura.
+        """
+        with self._lock:
+            n = min(self._size, self.period_bytes)
+            first = min(n, self.capacity - self._start)
+            self._period[:first] = self._view[self._start:self._start + first]
+            self._period[first:n] = self._view[:n - first]
+            if n < self.period_bytes:
+                self._period[n:] = bytes(self.period_bytes - n)
+            self._start = (self._start + n) % self.capacity
+            self._size -= n
+            if self._size == 0 and self.ended:
+                self.playing = self.ended = False
+            self._update()
+            return self._period_view
+
+    def report(self, label="reproducción"):
+        """Muestra underruns, overruns y la ocupación máxima."""
+        print(
+            f"\n[{label}] capacidad={1000 * self.capacity / self.sample_width / self.rate:.0f} ms "
+            f"jitter={1000 * self.jitter_bytes / self.sample_width / self.rate:.0f} ms "
+            f"máx ocupado={1000 * self.max_buffered / self.sample_width / self.rate:.0f} ms "
+            f"underruns={self.underruns} overruns={self.overruns} ({self.overrun_bytes} bytes)"
+        )
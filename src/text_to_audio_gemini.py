@@ -1,15 +1,25 @@
+import argparse
 import asyncio
 import base64
 import contextlib
+import csv
 import datetime
+import hashlib
 import os
 import json
+import sys
+import time
 import wave
 import itertools
 from dotenv import load_dotenv
 from google import genai
 import shutil
 
+# La caché de respuestas está en src_RAG, junto a la caché de consultas (ver "Estructura" en
+# readme.md). Se añade al final de sys.path para no tapar los módulos de src ni los instalados.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_RAG"))
+from response_cache import ResponseCache
+
 from IPython.display import display, Audio
 
 MODEL = "gemini-2.0-flash-exp"
@@ -19,7 +29,17 @@ load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+# El cliente se crea al usarlo (ver `get_client`): con --simular no hacen falta credenciales.
+client = None
+
+
+def get_client():
+    """Cliente de la API del módulo; se crea la primera vez que se pide."""
+    global client
+    if client is None:
+        client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+    return client
+
 
 def borrar_todos_los_audios(folder_path):
     """ 
@@ -85,9 +105,11 @@ config = {
 }
 
 async def main():
+    # Las preguntas repetidas reutilizan el audio ya generado sin abrir un turno en el modelo.
+    cache = ResponseCache()
     borrar_todos_los_audios('./audios')
     numero = 0
-    async with client.aio.live.connect(model=MODEL, config=config) as session:
+    async with get_client().aio.live.connect(model=MODEL, config=config) as session:
         
         while True:
             message = input("\nHablame--> ")
@@ -95,22 +117,222 @@ async def main():
                 break
             numero += 1
             file_name = f'./audios/audio_{numero}.wav'
+
+            if (hit := cache.get(message)) is not None:
+                with wave_file(file_name) as wav:
+                    wav.writeframes(hit.audio)
+                print(f"Respuesta en caché ({hit.latency:.2f} s ahorrados)")
+                continue
             
             with wave_file(file_name) as wav:    
-                
+                started = time.perf_counter()
+                audio = bytearray()
                 await session.send(input=message, end_of_turn=True)
 
                 turn = session.receive()
                 async for n,response in async_enumerate(turn):
                     if response.data is not None:
                         wav.writeframes(response.data)
+                        audio += response.data
 
                         if n==0:
                             print(response.server_content.model_turn.parts[0].inline_data.mime_type)
                         print('.', end='')
+            cache.put(message, audio, time.perf_counter() - started)
+
+        cache.report()
 
 
     #display(Audio(file_name, autoplay=True)) # Esto es para mostrar el audio en el notebook
-    
+
+
+def load_prompts(path):
+    """
+    Lee las preguntas de un lote desde un JSONL (un objeto por línea con "prompt"
+    y opcionalmente "id") o un CSV con columnas `prompt` e `id`.
+
+    Args:
+        path (str): Fichero .jsonl o .csv.
+
+    Returns:
+        List[dict]: Preguntas con 'id' y 'prompt'. Si no se indica 'id' se usa un hash de la
+        pregunta, así el nombre del audio no cambia aunque se reordene el fichero.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    items = []
+    for row in rows:
+        prompt = (row.get("prompt") or "").strip()
+        if prompt:
+            key = str(row.get("id") or hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16])
+            items.append({"id": key, "prompt": prompt})
+    return items
+
+
+class RateLimiter:
+    """Reparte el inicio de los turnos para no pasar de `rate` por segundo entre todas las sesiones."""
+
+    def __init__(self, rate=None):
+        """
+        Args:
+            rate (float, opcional): Turnos por segundo como máximo. None = sin límite.
+        """
+        self.interval = 1 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def render_prompt(session, prompt, path):
+    """
+    Genera el audio de una pregunta en `path`. Se escribe en un fichero temporal
+    que sólo se renombra al terminar el turno, así un audio a medias nunca cuenta
+    como hecho al reanudar el lote.
+
+    Returns:
+        bytes: El audio generado.
+    """
+    tmp = path + ".tmp"
+    audio = bytearray()
+    try:
+        with wave_file(tmp) as wav:
+            await session.send(input=prompt, end_of_turn=True)
+            async for response in session.receive():
+                if response.data is not None:
+                    wav.writeframes(response.data)
+                    audio += response.data
+        if not audio:
+            raise RuntimeError("La respuesta no tiene audio")
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+    return bytes(audio)
+
+
+async def batch_worker(queue, out_dir, limiter, cache, stats, retries=3, backoff=1.0):
+    """
+    Una sesión del pool: abre una conexión y va sacando preguntas de `queue`. Si
+    falla la conexión o un turno, la sesión se vuelve a abrir y la pregunta en
+    curso se reintenta con espera exponencial hasta `retries` veces.
+    """
+    item, attempt = None, 0
+    while True:
+        # La pregunta se toma antes de conectar para que un fallo al abrir la
+        # sesión cuente como un intento más y no tumbe todo el lote.
+        if item is None:
+            if queue.empty():
+                return
+            item, attempt = queue.get_nowait(), 0
+        try:
+            async with get_client().aio.live.connect(model=MODEL, config=config) as session:
+                while True:
+                    path = os.path.join(out_dir, f"{item['id']}.wav")
+                    if (hit := cache.get(item["prompt"])) is not None:
+                        with wave_file(path + ".tmp") as wav:
+                            wav.writeframes(hit.audio)
+                        os.replace(path + ".tmp", path)
+                        stats["caché"] += 1
+                    else:
+                        await limiter.wait()
+                        started = time.perf_counter()
+                        audio = await render_prompt(session, item["prompt"], path)
+                        latency = time.perf_counter() - started
+                        cache.put(item["prompt"], audio, latency)
+                        stats["latencias"].append(latency)
+                        stats["generados"] += 1
+                    print('.', end='', flush=True)
+                    if queue.empty():
+                        return
+                    item, attempt = queue.get_nowait(), 0
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                print(f"\nFallo definitivo en {item['id']}: {e}")
+                stats["fallidos"].append(item["id"])
+                item = None
+            else:
+                stats["reintentos"] += 1
+                await asyncio.sleep(backoff * 2 ** (attempt - 1))
+
+
+async def batch(path, out_dir="./audios_lote", sessions=4, rate=None, retries=3, backoff=1.0):
+    """
+    Genera el audio de todas las preguntas de un lote repartidas entre un pool de
+    sesiones Live. Se puede reanudar: las preguntas cuyo audio ya existe se saltan.
+
+    Args:
+        path (str): Fichero .jsonl o .csv de preguntas (ver `load_prompts`).
+        out_dir (str, opcional): Carpeta de salida; cada audio se llama `<id>.wav`.
+        sessions (int, opcional): Sesiones simultáneas. Por defecto 4.
+        rate (float, opcional): Turnos por segundo como máximo entre todas las sesiones.
+        retries (int, opcional): Reintentos por pregunta. Por defecto 3.
+        backoff (float, opcional): Espera (s) antes del primer reintento; se duplica en cada uno.
+
+    Returns:
+        dict: Contadores del lote ('generados', 'saltados', 'duplicados', 'caché', 'reintentos', 'fallidos'...).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    items = load_prompts(path)
+    # Las preguntas repetidas comparten id y por tanto `<id>.wav`: se generan una sola vez
+    # para que dos sesiones no escriban a la vez el mismo fichero.
+    unique = {}
+    for item in items:
+        unique.setdefault(item["id"], item)
+    pending = [item for item in unique.values() if not os.path.exists(os.path.join(out_dir, f"{item['id']}.wav"))]
+    stats = {"total": len(items), "duplicados": len(items) - len(unique), "saltados": len(unique) - len(pending),
+             "generados": 0, "caché": 0, "reintentos": 0, "fallidos": [], "latencias": []}
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    limiter = RateLimiter(rate)
+    cache = ResponseCache()
+    started = time.perf_counter()
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(min(sessions, len(pending))):
+            tg.create_task(batch_worker(queue, out_dir, limiter, cache, stats, retries, backoff))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(stats["latencias"])
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    print(
+        f"\n[lote] {stats['total']} preguntas: generadas={stats['generados']} saltadas={stats['saltados']} "
+        f"duplicadas={stats['duplicados']} "
+        f"caché={stats['caché']} reintentos={stats['reintentos']} fallidas={len(stats['fallidos'])} "
+        f"en {elapsed:.1f} s ({(stats['generados'] + stats['caché']) / max(elapsed, 1e-9):.2f}/s, "
+        f"latencia p50={p50:.2f} s)"
+    )
+    return stats
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lote", default=None, metavar="FICHERO",
+                        help="Genera el audio de las preguntas de un .jsonl/.csv en vez del modo interactivo")
+    parser.add_argument("--salida", default="./audios_lote", help="Carpeta de los audios del lote")
+    parser.add_argument("--sesiones", type=int, default=4, help="Sesiones Live simultáneas")
+    parser.add_argument("--por-segundo", type=float, default=None, metavar="N",
+                        help="Turnos por segundo como máximo entre todas las sesiones")
+    parser.add_argument("--reintentos", type=int, default=3, help="Reintentos por pregunta")
+    parser.add_argument("--simular", action="store_true",
+                        help="Usa la API Live simulada de live_mock (sin red)")
+    parser.add_argument("--fallos", type=float, default=0.0, metavar="P",
+                        help="Con --simular, probabilidad de que se corte cada respuesta")
+    args = parser.parse_args()
+    if args.simular:
+        from live_mock import MockClient
+        client = MockClient(first_chunk_delay=0.3, chunk_interval=0.02, failure_rate=args.fallos)
+    if args.lote:
+        asyncio.run(batch(args.lote, args.salida, args.sesiones, args.por_segundo, args.reintentos))
+    else:
+        asyncio.run(main())
\ No newline at end of file
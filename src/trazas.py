@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+
+# Límites superiores (s) de los cubos de los histogramas, como en Prometheus.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+
+class Histogram:
+    """Histograma acumulativo de duraciones con cubos fijos."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def percentile(self, q):
+        """Límite superior del cubo que contiene el percentil `q` (0-100)."""
+        target, seen = self.count * q / 100, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target and seen:
+                return min(bound, self.max)
+        return 0.0
+
+
+class Tracer:
+    """
+    Instrumentación de `AudioLoop`: histogramas de duración por etapa
+    (lectura del micrófono, espera en cola, envío, reproducción...),
+    profundidad de las colas, contadores de trozos descartados y un registro
+    por turno. Se puede volcar cada medida a un fichero JSONL y servir las
+    métricas en formato de texto de Prometheus.
+
+    Ejemplo:
+        tracer = Tracer("trazas.jsonl")
+        loop = AudioLoop(tracer=tracer)
+        ...
+        tracer.report()
+    """
+
+    enabled = True
+
+    def __init__(self, path=None, buckets=DEFAULT_BUCKETS, prefix="audioloop"):
+        """
+        Args:
+            path (str, opcional): Fichero JSONL en el que se escribe cada medida y cada turno.
+            buckets (Tuple[float], opcional): Cubos de los histogramas en segundos.
+            prefix (str, opcional): Prefijo de las métricas de Prometheus. Por defecto "audioloop".
+        """
+        self.start = time.perf_counter()
+        self.buckets = buckets
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.depths = {}
+        self.max_depths = {}
+        self.marks = {}
+        self.turns = 0
+        self._turn = None
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def _write(self, kind, **fields):
+        if self._file is not None:
+            fields["t"] = round(time.perf_counter() - self.start, 6)
+            fields["tipo"] = kind
+            self._file.write(json.dumps(fields) + "\n")
+
+    def observe(self, stage, seconds):
+        """Anota la duración (s) de una etapa."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        self._write("etapa", etapa=stage, s=round(seconds, 6))
+
+    def count(self, name, n=1):
+        """Suma `n` a un contador (trozos descartados, colas llenas...)."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def mark(self, name, at=None):
+        """Guarda el instante `at` (por defecto, ahora) de un suceso, p. ej. el fin de la voz del usuario."""
+        self.marks[name] = time.perf_counter() if at is None else at
+
+    def gauge(self, name, value):
+        """Anota el valor actual de una ocupación (profundidad de cola, audio almacenado...)."""
+        self.depths[name] = value
+        self.max_depths[name] = max(self.max_depths.get(name, 0), value)
+
+    def turn_chunk(self, size):
+        """Anota un trozo de respuesta; el primero abre el turno."""
+        now = time.perf_counter()
+        if self._turn is None:
+            self._turn = {"inicio": now, "trozos": 0, "bytes": 0}
+            if (user_end := self.marks.pop("fin_usuario", None)) is not None:
+                self.observe("modelo", now - user_end)
+        self._turn["trozos"] += 1
+        self._turn["bytes"] += size
+
+    def turn_end(self, discarded=0):
+        """Cierra el turno actual; `discarded` es el audio (bytes) que no llegó a reproducirse."""
+        turn, self._turn = self._turn, None
+        if turn is None:
+            return
+        self.turns += 1
+        duration = time.perf_counter() - turn["inicio"]
+        self.observe("respuesta", duration)
+        self._write("turno", n=self.turns, s=round(duration, 6), trozos=turn["trozos"],
+                    bytes=turn["bytes"], descartados=discarded)
+
+    def prometheus(self):
+        """Métricas en formato de texto de Prometheus."""
+        p = self.prefix
+        lines = [f"# TYPE {p}_etapa_segundos histogram"]
+        for stage, histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{p}_etapa_segundos_bucket{{etapa="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{p}_etapa_segundos_sum{{etapa="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{p}_etapa_segundos_count{{etapa="{stage}"}} {histogram.count}')
+        lines.append(f"# TYPE {p}_ocupacion gauge")
+        lines += [f'{p}_ocupacion{{medida="{name}"}} {value}' for name, value in self.depths.items()]
+        lines.append(f"# TYPE {p}_ocupacion_max gauge")
+        lines += [f'{p}_ocupacion_max{{medida="{name}"}} {value}' for name, value in self.max_depths.items()]
+        lines.append(f"# TYPE {p}_eventos_total counter")
+        lines += [f'{p}_eventos_total{{evento="{name}"}} {value}' for name, value in self.counters.items()]
+        lines.append(f"# TYPE {p}_turnos_total counter")
+        lines.append(f"{p}_turnos_total {self.turns}")
+        return "\n".join(lines) + "\n"
+
+    async def serve_metrics(self, host="127.0.0.1", port=9464):
+        """
+        Sirve `prometheus()` por HTTP en cualquier ruta (p. ej. /metrics).
+
+        Returns:
+            asyncio.Server: Servidor ya escuchando.
+        """
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            body = self.prometheus().encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    def report(self, label="trazas"):
+        """Muestra un resumen por etapa, colas y contadores."""
+        print(f"\n[{label}] turnos={self.turns}")
+        for stage, h in self.histograms.items():
+            print(f"  {stage:<20} n={h.count:<6} media={1000 * h.sum / max(h.count, 1):7.1f} ms "
+                  f"p50<={1000 * h.percentile(50):7.1f} ms p95<={1000 * h.percentile(95):7.1f} ms "
+                  f"máx={1000 * h.max:7.1f} ms")
+        for name, depth in self.max_depths.items():
+            print(f"  {name:<20} máx={depth:.0f}")
+        for name, value in self.counters.items():
+            print(f"  {name:<20} {value}")
+
+    def close(self):
+        """Cierra el fichero JSONL."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class NullTracer:
+    """Tracer que no hace nada: es el que usa `AudioLoop` si no se activan las trazas."""
+
+    enabled = False
+
+    def observe(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def mark(self, name, at=None):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def turn_chunk(self, size):
+        pass
+
+    def turn_end(self, discarded=0):
+        pass
+
+    def report(self, label="trazas"):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,133 @@
+import time
+from collections import deque
+
+import numpy as np
+
+
+def level_db(chunk, subframe=256):
+    """
+    Nivel de un trozo de audio: RMS de la subtrama más fuerte, en dBFS.
+
+    Args:
+        chunk (bytes): Trozo PCM int16 mono.
+        subframe (int, opcional): Muestras por subtrama. Por defecto 256.
+
+    Returns:
+        float: Nivel en dBFS (-inf si el trozo está vacío).
+    """
+    samples = np.frombuffer(chunk, dtype='<i2').astype(np.float32)
+    if not samples.size:
+        return -np.inf
+    usable = samples.size - samples.size % subframe
+    frames = samples[:usable].reshape(-1, subframe) if usable else samples[None, :]
+    rms = np.sqrt(np.mean(frames * frames, axis=1)).max()
+    return 20 * np.log10(max(rms, 1.0) / 32768)
+
+
+class VoiceActivityDetector:
+    """
+    Detector de voz por energía entre el micrófono y `out_queue`: los trozos
+    de silencio no se envían. Cada trozo se divide en subtramas y se calcula
+    su nivel RMS en dBFS de una vez con NumPy; hay voz si alguna subtrama
+    supera el umbral, que es el mayor entre `min_db` y el ruido de fondo
+    estimado más `margin_db`.
+
+    Los últimos `preroll` segundos de silencio se guardan y se envían justo
+    antes de la voz para no cortar el principio de las palabras, y tras la voz
+    se siguen enviando `hangover` segundos para que el servidor detecte el fin
+    del turno.
+
+    Ejemplo:
+        vad = VoiceActivityDetector()
+        for chunk in vad.process(data):
+            await sender.put(chunk)
+    """
+
+    def __init__(self, rate=16000, chunk_size=1024, min_db=-50.0, margin_db=10.0, preroll=0.3,
+                 hangover=0.8, subframe=256, noise_adaptation=0.05, on_speech_end=None):
+        """
+        Args:
+            rate (int, opcional): Frecuencia de muestreo en Hz. Por defecto 16000.
+            chunk_size (int, opcional): Muestras por trozo del micrófono. Por defecto 1024.
+            min_db (float, opcional): Nivel mínimo (dBFS) para considerar voz. Por defecto -50.
+            margin_db (float, opcional): dB por encima del ruido de fondo para considerar voz. Por defecto 10.
+            preroll (float, opcional): Segundos de audio previos a la voz que se envían con ella. Por defecto 0.3.
+            hangover (float, opcional): Segundos que se siguen enviando tras la voz. Por defecto 0.8.
+            subframe (int, opcional): Muestras por subtrama al medir la energía. Por defecto 256.
+            noise_adaptation (float, opcional): Peso de cada trozo de silencio en la estimación del
+                ruido de fondo. Por defecto 0.05.
+            on_speech_end (Callable[[float], None], opcional): Se llama al cerrar un tramo de voz (pasado
+                el `hangover`) con el instante (`time.perf_counter()`) del último trozo con voz.
+        """
+        chunk_seconds = chunk_size / rate
+        self.min_db = min_db
+        self.margin_db = margin_db
+        self.subframe = subframe
+        self.noise_adaptation = noise_adaptation
+        self.on_speech_end = on_speech_end
+        self.hangover_chunks = int(np.ceil(hangover / chunk_seconds))
+        self.preroll = deque(maxlen=int(np.ceil(preroll / chunk_seconds)))
+        self.noise_db = min_db - margin_db
+        self.speaking = False
+        self._silent_chunks = 0
+        self._last_voice = None
+        self.chunks_in = 0
+        self.chunks_sent = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+        self.segments = 0
+
+    @property
+    def threshold_db(self):
+        """Umbral actual de voz en dBFS."""
+        return max(self.min_db, self.noise_db + self.margin_db)
+
+    def level_db(self, chunk):
+        """Nivel (dBFS) de la subtrama más fuerte de un trozo PCM int16."""
+        return level_db(chunk, self.subframe)
+
+    def process(self, chunk):
+        """
+        Decide qué enviar tras leer un trozo del micrófono.
+
+        Args:
+            chunk (bytes): Trozo PCM int16 mono.
+
+        Returns:
+            List[bytes]: Trozos a enviar en orden (vacía si es silencio).
+        """
+        self.chunks_in += 1
+        self.bytes_in += len(chunk)
+        level = self.level_db(chunk)
+        if level >= self.threshold_db:
+            out = list(self.preroll) + [chunk] if not self.speaking else [chunk]
+            self.preroll.clear()
+            if not self.speaking:
+                self.segments += 1
+            self.speaking = True
+            self._silent_chunks = 0
+            self._last_voice = time.perf_counter()
+        else:
+            self.noise_db += self.noise_adaptation * (level - self.noise_db)
+            if self.speaking and self._silent_chunks < self.hangover_chunks:
+                self._silent_chunks += 1
+                out = [chunk]
+            else:
+                if self.speaking:
+                    self.speaking = False
+                    if self.on_speech_end is not None:
+                        self.on_speech_end(self._last_voice)
+                self.preroll.append(chunk)
+                out = []
+        self.chunks_sent += len(out)
+        self.bytes_sent += sum(len(c) for c in out)
+        return out
+
+    def report(self, label="vad"):
+        """Muestra cuánto audio se ha dejado de enviar."""
+        saved = self.bytes_in - self.bytes_sent
+        print(
+            f"\n[{label}] tramos de voz={self.segments} trozos enviados={self.chunks_sent}/{self.chunks_in} "
+            f"bytes ahorrados={saved} ({saved / max(self.bytes_in, 1):.0%}) "
+            f"umbral={self.threshold_db:.1f} dBFS"
+        )
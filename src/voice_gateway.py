@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import struct
+import sys
+import time
+
+from voice_to_voice_gemini import AudioLoop, CHUNK_SIZE, SEND_SAMPLE_RATE, get_client
+
+# Protocolo: cada mensaje es un tipo de 1 byte y una longitud de 4 bytes seguidos del contenido.
+FRAME_HEADER = struct.Struct("!cI")
+AUDIO = b"A"    # PCM int16 mono (16 kHz hacia la pasarela, 24 kHz de vuelta)
+TEXT = b"T"     # Texto UTF-8 (pregunta del cliente o texto de la respuesta)
+END = b"E"      # Fin de turno del modelo
+ERROR = b"X"    # Error; la pasarela cierra la conexión a continuación
+MAX_FRAME = 1 << 20
+
+
+async def read_frame(reader):
+    """
+    Lee un mensaje del socket.
+
+    Args:
+        reader (asyncio.StreamReader): Extremo de lectura de la conexión.
+
+    Returns:
+        Tuple[bytes, bytes] | Tuple[None, None]: Tipo y contenido, o (None, None) si se cerró la
+        conexión o el mensaje supera `MAX_FRAME`.
+    """
+    try:
+        kind, size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        if size > MAX_FRAME:
+            return None, None
+        return kind, await reader.readexactly(size)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None, None
+
+
+def write_frame(writer, kind, payload=b""):
+    """Escribe un mensaje en el socket (sin esperar a que se vacíe el búfer)."""
+    writer.write(FRAME_HEADER.pack(kind, len(payload)))
+    writer.write(payload)
+
+
+class ClientLoop(AudioLoop):
+    """
+    `AudioLoop` para un cliente remoto: el micrófono y el altavoz son la
+    conexión TCP en lugar de PyAudio. Las dos colas están acotadas y, si se
+    llenan, se descarta el trozo más antiguo (o el silencio, según
+    `send_policy`), así un cliente lento sólo pierde su propio audio y no
+    retiene memoria ni tiempo del resto.
+    """
+
+    def __init__(self, reader, writer, name, rag=None, audio_in_queue_size=50, send_policy="drop-oldest", **options):
+        """
+        Args:
+            reader (asyncio.StreamReader): Extremo de lectura de la conexión.
+            writer (asyncio.StreamWriter): Extremo de escritura de la conexión.
+            name (str): Nombre del cliente para los informes.
+            rag (Rag, opcional): Índice compartido para añadir contexto a las preguntas de texto.
+            audio_in_queue_size (int, opcional): Mensajes pendientes de enviar al cliente. Por defecto 50.
+            send_policy (str, opcional): Política de la cola hacia el modelo; no puede ser "block"
+                porque pararía la lectura del socket. Por defecto "drop-oldest".
+            **options: Resto de parámetros de `AudioLoop` (client, model, config, out_queue_size...).
+        """
+        if send_policy == "block":
+            raise ValueError("La pasarela no admite la política 'block'")
+        super().__init__(send_policy=send_policy, **options)
+        self.audio_in_queue_size = audio_in_queue_size
+        self.audio_in_queue = None
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.rag = rag
+        self.text_task = None
+        self.disconnected = asyncio.Event()
+        self.started = time.perf_counter()
+        self.chunks_in = 0
+        self.chunks_out = 0
+        self.dropped_out = 0
+        self.turns = 0
+
+    @staticmethod
+    def _put_dropping_oldest(queue, item):
+        """Encola sin bloquear; si la cola está llena descarta el elemento más antiguo. Devuelve si descartó."""
+        dropped = queue.full()
+        if dropped:
+            queue.get_nowait()
+        queue.put_nowait(item)
+        return dropped
+
+    def create_playback(self):
+        # La reproducción es del cliente: aquí basta una cola acotada de mensajes hacia el socket.
+        self.audio_in_queue = asyncio.Queue(maxsize=self.audio_in_queue_size)
+
+    async def send_text(self, text):
+        """Envía una pregunta de texto, con contexto de rag si la pasarela tiene índice."""
+        if self.rag is not None:
+            context = "\n".join(await self.rag.aget_chunk_relevates(text))
+            text = f"Basándote en el siguiente contexto, responde la pregunta.\n\nContexto:\n{context}\n\nPregunta: {text}"
+        await self.session.send(input=text, end_of_turn=True)
+
+    async def listen_audio(self):
+        while True:
+            kind, payload = await read_frame(self.reader)
+            if kind is None:
+                break
+            if kind == AUDIO:
+                self.chunks_in += 1
+                await self.sender.put(payload)
+            elif kind == TEXT:
+                # La búsqueda en rag no frena la lectura del socket; una pregunta nueva
+                # sustituye a la anterior si aún se está preparando.
+                if self.text_task is not None and not self.text_task.done():
+                    self.text_task.cancel()
+                self.text_task = asyncio.create_task(self.send_text(payload.decode("utf-8")))
+        self.disconnected.set()
+
+    async def receive_audio(self):
+        while True:
+            turn = self.session.receive()
+            async for response in turn:
+                if data := response.data:
+                    self.dropped_out += self._put_dropping_oldest(self.audio_in_queue, (AUDIO, data))
+                elif text := response.text:
+                    self.dropped_out += self._put_dropping_oldest(self.audio_in_queue, (TEXT, text.encode("utf-8")))
+            self.turns += 1
+            self._put_dropping_oldest(self.audio_in_queue, (END, b""))
+
+    async def play_audio(self):
+        try:
+            while True:
+                kind, payload = await self.audio_in_queue.get()
+                write_frame(self.writer, kind, payload)
+                await self.writer.drain()
+                self.chunks_out += kind == AUDIO
+        except ConnectionError:
+            self.disconnected.set()
+
+    async def serve(self):
+        """Ejecuta la sesión hasta que el cliente se desconecta o la sesión termina."""
+        run = asyncio.create_task(self.run())
+        disconnected = asyncio.create_task(self.disconnected.wait())
+        await asyncio.wait({run, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (run, disconnected, self.text_task):
+            if task is None:
+                continue
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def stats(self):
+        """Contadores del cliente."""
+        sent = self.sender.counters if self.sender is not None else {}
+        return {
+            "cliente": self.name,
+            "duracion": round(time.perf_counter() - self.started, 3),
+            "turnos": self.turns,
+            "trozos_recibidos": self.chunks_in,
+            "trozos_descartados_entrada": sent.get("descartados_antiguos", 0) + sent.get("descartados_silencio", 0),
+            "mensajes_al_modelo": sent.get("mensajes", 0),
+            "trozos_enviados": self.chunks_out,
+            "trozos_descartados_salida": self.dropped_out,
+        }
+
+
+class VoiceGateway:
+    """
+    Pasarela que atiende a muchos clientes de voz en un solo proceso: cada
+    conexión tiene su propio `ClientLoop` y su sesión Live, todos en el mismo
+    bucle de eventos y compartiendo el `genai.Client` y, si se indica, el
+    índice `Rag`.
+
+    Ejemplo:
+        gateway = VoiceGateway(rag=Rag('./libros', background=True))
+        server = await gateway.start("127.0.0.1", 8765)
+        async with server:
+            await server.serve_forever()
+    """
+
+    def __init__(self, client=None, rag=None, max_clients=32, **loop_options):
+        """
+        Args:
+            client (genai.Client, opcional): Cliente compartido por todas las sesiones. Por defecto
+                el de `voice_to_voice_gemini.get_client`, creado con la primera conexión.
+            rag (Rag, opcional): Índice compartido para las preguntas de texto.
+            max_clients (int, opcional): Conexiones simultáneas máximas. Por defecto 32.
+            **loop_options: Parámetros de cada `ClientLoop` (model, config, tamaños de cola).
+        """
+        self.client = client
+        self.rag = rag
+        self.max_clients = max_clients
+        self.loop_options = loop_options
+        self.loops = {}
+        self.finished = []
+        self.rejected = 0
+
+    async def handle(self, reader, writer):
+        """Atiende una conexión de principio a fin."""
+        name = "{}:{}".format(*writer.get_extra_info("peername")[:2])
+        try:
+            if len(self.loops) >= self.max_clients:
+                self.rejected += 1
+                write_frame(writer, ERROR, "La pasarela está llena".encode("utf-8"))
+                await writer.drain()
+                return
+            loop = ClientLoop(reader, writer, name, rag=self.rag, client=self.client or get_client(),
+                              **self.loop_options)
+            self.loops[name] = loop
+            try:
+                await loop.serve()
+            finally:
+                del self.loops[name]
+                self.finished.append(loop.stats())
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Abre el socket de escucha.
+
+        Returns:
+            asyncio.Server: Servidor ya escuchando.
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+    def report(self):
+        """Muestra los contadores de los clientes atendidos."""
+        print(f"\n[pasarela] activos={len(self.loops)} atendidos={len(self.finished)} rechazados={self.rejected}")
+        for stats in self.finished + [loop.stats() for loop in self.loops.values()]:
+            print("  " + " ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+async def scripted_client(host, port, pcm, turns, chunk_bytes=CHUNK_SIZE * 2, realtime=True, timeout=30):
+    """
+    Cliente de prueba: envía `pcm` en trozos (a ritmo real si `realtime`) y
+    espera a recibir `turns` respuestas completas.
+
+    Args:
+        host (str): Dirección de la pasarela.
+        port (int): Puerto de la pasarela.
+        pcm (bytes): Audio int16 mono a 16 kHz.
+        turns (int): Respuestas que se esperan.
+        chunk_bytes (int, opcional): Bytes por trozo. Por defecto los de `CHUNK_SIZE` muestras.
+        realtime (bool, opcional): Espaciar los trozos según su duración. Por defecto True.
+        timeout (float, opcional): Segundos máximos de espera. Por defecto 30.
+
+    Returns:
+        dict: Bytes de audio recibidos, turnos completados y tiempos (s) hasta el primer audio y hasta el final.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    started = time.perf_counter()
+    result = {"audio_bytes": 0, "turnos": 0, "primer_audio": None, "total": None}
+
+    async def receive():
+        while result["turnos"] < turns:
+            kind, payload = await read_frame(reader)
+            if kind is None or kind == ERROR:
+                return
+            if kind == AUDIO:
+                result["audio_bytes"] += len(payload)
+                if result["primer_audio"] is None:
+                    result["primer_audio"] = time.perf_counter() - started
+            elif kind == END:
+                result["turnos"] += 1
+
+    receiver = asyncio.create_task(receive())
+    period = chunk_bytes / 2 / SEND_SAMPLE_RATE
+    try:
+        for i, start in enumerate(range(0, len(pcm), chunk_bytes)):
+            write_frame(writer, AUDIO, pcm[start:start + chunk_bytes])
+            await writer.drain()
+            if realtime:
+                await asyncio.sleep(max(0.0, started + (i + 1) * period - time.perf_counter()))
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(receiver, timeout)
+    except ConnectionError:
+        # La pasarela ha rechazado o cerrado la conexión.
+        receiver.cancel()
+    result["total"] = time.perf_counter() - started
+    writer.close()
+    with contextlib.suppress(ConnectionError):
+        await writer.wait_closed()
+    return result
+
+
+async def simulate(clients, seconds, max_clients):
+    """Arranca la pasarela con `live_mock` y lanza `clients` clientes de prueba a la vez."""
+    from live_mock import MockClient, synthetic_pcm
+
+    gateway = VoiceGateway(client=MockClient(turn_seconds=1.0), max_clients=max_clients)
+    server = await gateway.start("127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    async with server:
+        pcm = synthetic_pcm(seconds, rate=SEND_SAMPLE_RATE)
+        results = await asyncio.gather(*(scripted_client(host, port, pcm, turns=int(seconds)) for _ in range(clients)))
+        await asyncio.sleep(0.1)
+    gateway.report()
+    first = sorted(r["primer_audio"] for r in results if r["primer_audio"] is not None)
+    completed = sum(r["turnos"] >= int(seconds) for r in results)
+    print(f"\n[simulación] clientes={clients} completos={completed}")
+    if first:
+        print(f"  primer audio: mediana={first[len(first) // 2]:.3f} s máx={first[-1]:.3f} s")
+
+
+async def serve(host, port, max_clients, books):
+    rag = None
+    if books:
+        # El índice rag está en src_RAG (al final de sys.path, como en text_to_audio_gemini);
+        # se comparte entre todas las sesiones.
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src_RAG"))
+        from rag import Rag
+        rag = Rag(books, background=True)
+    gateway = VoiceGateway(rag=rag, max_clients=max_clients)
+    server = await gateway.start(host, port)
+    print(f"Pasarela escuchando en {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        gateway.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pasarela de voz para varios clientes remotos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-clientes", type=int, default=32)
+    parser.add_argument("--libros", default=None, help="Carpeta de documentos para compartir un índice rag")
+    parser.add_argument("--simular", type=int, default=0, metavar="N",
+                        help="Prueba local: N clientes contra una API Live simulada")
+    parser.add_argument("--segundos", type=float, default=2.0, help="Audio por cliente al simular")
+    args = parser.parse_args()
+    try:
+        if args.simular:
+            asyncio.run(simulate(args.simular, args.segundos, args.max_clientes))
+        else:
+            asyncio.run(serve(args.host, args.port, args.max_clientes, args.libros))
+    except KeyboardInterrupt:
+        pass
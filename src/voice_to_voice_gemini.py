@@ -1,6 +1,7 @@
 import asyncio
 import os
 import sys
+import time
 import traceback
 
 import pyaudio
@@ -9,6 +10,12 @@ import argparse
 from google import genai
 from dotenv import load_dotenv
 
+from audio_io import AudioIOStats, CallbackMicrophone, CallbackSpeaker
+from envio import POLICIES, SendPipeline
+from ring_buffer import PcmRingBuffer
+from trazas import NULL_TRACER, Tracer
+from vad import VoiceActivityDetector, level_db
+
 if sys.version_info < (3, 11, 0):
     import taskgroup, exceptiongroup
     asyncio.TaskGroup = taskgroup.TaskGroup
@@ -26,7 +33,27 @@ MODEL = "models/gemini-2.0-flash-exp"
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+# El cliente y PyAudio se crean al usarlos por primera vez (ver `get_client` y `get_pyaudio`):
+# así la pasarela y las pruebas con `live_mock` importan este módulo sin credenciales ni audio.
+client = None
+pya = None
+
+
+def get_client():
+    """Cliente de la API del módulo; se crea la primera vez que se pide."""
+    global client
+    if client is None:
+        client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
+    return client
+
+
+def get_pyaudio():
+    """Instancia de PyAudio del módulo; se crea la primera vez que se pide."""
+    global pya
+    if pya is None:
+        pya = pyaudio.PyAudio()
+    return pya
+
 
 TIPO = "AUDIO"          #"TEXTO" o "AUDIO"
 
@@ -44,17 +71,84 @@ CONFIG = {
     }
 }
 
-pya = pyaudio.PyAudio()
-
 class AudioLoop:
-    def __init__(self):
-        self.audio_in_queue = None
-        self.out_queue = None
+    def __init__(self, client=None, model=MODEL, config=CONFIG, out_queue_size=5, buffer_seconds=10.0,
+                 jitter_ms=120, tracer=None, vad=None, send_policy="drop-silence-first", max_frame_chunks=4,
+                 audio_backend="callback", barge_in=False, barge_in_db=-35.0):
+        """
+        Args:
+            client (genai.Client, opcional): Cliente con el que se abre la sesión Live. Por defecto el
+                del módulo (`get_client`); se puede pasar uno compartido o un `live_mock.MockClient`.
+            model (str, opcional): Modelo de la sesión.
+            config (dict, opcional): Configuración de la sesión.
+            out_queue_size (int, opcional): Trozos de micrófono pendientes de enviar. Por defecto 5.
+            buffer_seconds (float, opcional): Audio de respuesta que cabe en el búfer de reproducción;
+                si se llena se deja de leer la sesión hasta que haya hueco. Por defecto 10 s.
+            jitter_ms (float, opcional): Audio acumulado antes de empezar a reproducir. Por defecto 120 ms.
+            tracer (trazas.Tracer, opcional): Instrumentación por etapa y por turno. Por defecto
+                `NULL_TRACER`, que no mide nada.
+            vad (vad.VoiceActivityDetector, opcional): Filtra el silencio del micrófono antes de
+                la cola de envío. Por defecto se envía todo.
+            send_policy (str, opcional): Qué hacer si la cola de envío se llena (ver `envio.POLICIES`).
+                Por defecto "drop-silence-first".
+            max_frame_chunks (int, opcional): Trozos que se pueden juntar en un mensaje cuando el
+                envío se retrasa. 1 = un mensaje por trozo. Por defecto 4.
+            audio_backend (str, opcional): "callback" (PortAudio llama desde su hilo y los trozos pasan
+                al bucle con `call_soon_threadsafe`) o "blocking" (un `asyncio.to_thread` por lectura y
+                por escritura). Por defecto "callback".
+            barge_in (bool, opcional): Si el micrófono detecta voz mientras suena la respuesta, se
+                vacía el búfer de reproducción al momento y se descarta el resto de ese turno, sin
+                esperar a que el servidor lo interrumpa. No hay cancelación de eco: con altavoces el
+                propio audio de la respuesta puede cortarla, por eso sólo conviene con auriculares.
+                Por defecto False.
+            barge_in_db (float, opcional): Nivel (dBFS) del micrófono que cuenta como voz para la
+                interrupción; más alto que el del VAD para que el ruido de fondo no la dispare.
+                Por defecto -35.
+        """
+        self.client = client
+        self.model = model
+        self.config = config
+        self.out_queue_size = out_queue_size
+        self.buffer_seconds = buffer_seconds
+        self.jitter_ms = jitter_ms
+        self.playback = None
         self.session = None
+        self.audio_stream = None
+        self.tracer = tracer or NULL_TRACER
+        self.vad = vad
+        self.send_policy = send_policy
+        self.max_frame_chunks = max_frame_chunks
+        self.sender = None
+        self.audio_backend = audio_backend
+        self.audio_stats = AudioIOStats()
+        self.barge_in = barge_in
+        self.barge_in_db = barge_in_db
+        # Turnos numerados: `turn` es el que se está recibiendo, `written_turn` el último que ha
+        # dejado audio en el búfer e `interrupted_turn` el que ha cortado el usuario.
+        self.turn = 0
+        self.written_turn = None
+        self.interrupted_turn = None
+        self.interruptions = 0
+        self._discarded = 0
         
     
-    async def listen_audio(self):
+    async def _mic_chunks(self):
+        """Trozos del micrófono según `audio_backend`."""
+        pya = get_pyaudio()
         mic_info = pya.get_default_input_device_info()
+        if self.audio_backend == "callback":
+            mic = await asyncio.to_thread(
+                CallbackMicrophone, pya, asyncio.get_running_loop(), SEND_SAMPLE_RATE, CHUNK_SIZE,
+                self.audio_stats, input_device_index=mic_info["index"],
+            )
+            self.audio_stream = mic.stream
+            try:
+                while True:
+                    yield await mic.read()
+            finally:
+                # Como en `play_audio`, el stream se cierra también al cancelar.
+                mic.close()
+                self.audio_stream = None
         self.audio_stream = await asyncio.to_thread(
             pya.open,
             format=FORMAT,
@@ -66,29 +160,97 @@ class AudioLoop:
         )
         # En modo debug se desactiva la excepción por overflow.
         kwargs = {"exception_on_overflow": False} if __debug__ else {}
+
+        def read():
+            return self.audio_stream.read(CHUNK_SIZE, **kwargs), time.perf_counter()
+
         while True:
-            data = await asyncio.to_thread(self.audio_stream.read, CHUNK_SIZE, **kwargs)
-            await self.out_queue.put({"data": data, "mime_type": "audio/pcm"})
+            data, captured = await asyncio.to_thread(read)
+            self.audio_stats.hops += 1
+            self.audio_stats.hop_latency.append(time.perf_counter() - captured)
+            yield data
+
+    async def listen_audio(self):
+        started = time.perf_counter()
+        chunks = self._mic_chunks()
+        try:
+            async for data in chunks:
+                self.tracer.observe("leer_micro", time.perf_counter() - started)
+                if self.barge_in:
+                    self.check_barge_in(data)
+                for chunk in self.vad.process(data) if self.vad is not None else (data,):
+                    if self.sender.full():
+                        self.tracer.count("cola_salida_llena")
+                    # Con la política "block" el micrófono deja de leerse mientras espera (riesgo de overflow).
+                    await self.sender.put(chunk)
+                started = time.perf_counter()
+        finally:
+            # Se cierra el generador ya, no cuando lo recoja el recolector de basura.
+            await chunks.aclose()
     
+    def check_barge_in(self, data):
+        """
+        Interrupción local: si hay respuesta sonando y el trozo del micrófono supera `barge_in_db`,
+        se vacía el búfer y el turno que estaba sonando queda marcado como interrumpido. Si el
+        servidor ya lo había enviado entero, el turno siguiente (la respuesta a lo que acaba de
+        decir el usuario) se reproduce con normalidad.
+        """
+        if not len(self.playback) or level_db(data) < self.barge_in_db:
+            return
+        self.interrupted_turn = self.written_turn
+        self.interruptions += 1
+        self._discarded += self.playback.clear(since=time.perf_counter())
+        self.tracer.count("interrupciones_locales")
+
     async def send_realtime(self):
-        while True:
-            msg = await self.out_queue.get()
-            await self.session.send(input=msg)
+        await self.sender.run()
     
     async def receive_audio(self):
         while True:
             turn = self.session.receive()
+            interrupted = False
             async for response in turn:
                 if data := response.data:
-                    self.audio_in_queue.put_nowait(data)
+                    # Si el búfer está lleno se espera a que el altavoz libere hueco; mientras
+                    # tanto no se leen más mensajes de la sesión.
+                    await self.playback.wait_writable(len(data))
+                    if self.interrupted_turn == self.turn:
+                        # El usuario ya ha interrumpido este turno: el resto no se reproduce.
+                        self._discarded += len(data)
+                        continue
+                    self.written_turn = self.turn
+                    self.playback.write(data)
+                    self.tracer.gauge("reproduccion_ms", self.playback.buffered_ms)
+                    self.tracer.turn_chunk(len(data))
                     continue
                 if text := response.text:
                     print(text, end="")
-            # Limpia la cola de audio si se ha interrumpido la respuesta.
-            while not self.audio_in_queue.empty():
-                self.audio_in_queue.get_nowait()
+                if response.server_content is not None and getattr(response.server_content, "interrupted", False):
+                    interrupted = True
+                    self.interrupted_turn = None
+            # Si se ha interrumpido la respuesta se descarta el audio pendiente; si no, se
+            # reproduce lo que quede aunque no llegue al objetivo de jitter.
+            discarded = self.playback.clear() if interrupted else 0
+            if not interrupted:
+                self.playback.end_turn()
+            discarded += self._discarded
+            self._discarded = 0
+            # El turno siguiente empieza sin interrupción, aunque aún suene el audio de este.
+            self.turn += 1
+            self.interrupted_turn = None
+            self.tracer.count("bytes_descartados", discarded)
+            self.tracer.turn_end(discarded)
     
     async def play_audio(self):
+        pya = get_pyaudio()
+        if self.audio_backend == "callback":
+            # PortAudio saca cada periodo del búfer desde su hilo; esta tarea sólo mantiene el stream.
+            speaker = await asyncio.to_thread(
+                CallbackSpeaker, pya, self.playback, RECEIVE_SAMPLE_RATE, self.audio_stats)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                speaker.close()
         stream = await asyncio.to_thread(
             pya.open,
             format=FORMAT,
@@ -97,18 +259,59 @@ class AudioLoop:
             output=True,
         )
         while True:
-            bytestream = await self.audio_in_queue.get()
-            await asyncio.to_thread(stream.write, bytestream)    
+            started = time.perf_counter()
+            await self.playback.wait_period()
+            self.tracer.observe("espera_reproducir", time.perf_counter() - started)
+            # Siempre se escribe un periodo completo desde el mismo búfer preasignado.
+            period = self.playback.read_period()
+            self.tracer.gauge("reproduccion_ms", self.playback.buffered_ms)
+            if (arrived := self.playback.pop_arrival()) is not None:
+                self.audio_stats.output_latency.append(time.perf_counter() - arrived)
+            started = time.perf_counter()
+            self.audio_stats.hops += 1
+            await asyncio.to_thread(stream.write, period)
+            self.tracer.observe("escribir_altavoz", time.perf_counter() - started)
+
+
+    def report_barge_in(self, label="interrupción", target_ms=100):
+        """Muestra cuántas veces se ha cortado la respuesta y cuánto tardó el altavoz en callar."""
+        latencies = sorted(1000 * s for s in self.playback.silence_latency)
+        if not latencies:
+            print(f"\n[{label}] interrupciones={self.interruptions}")
+            return
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(
+            f"\n[{label}] interrupciones={self.interruptions} voz->silencio: "
+            f"media={sum(latencies) / len(latencies):.1f} ms p95={p95:.1f} ms máx={latencies[-1]:.1f} ms "
+            f"(objetivo < {target_ms} ms, sin contar la duración de un trozo del micrófono: "
+            f"{1000 * CHUNK_SIZE / SEND_SAMPLE_RATE:.0f} ms)"
+        )
+
+    def create_playback(self):
+        """Crea el búfer donde `receive_audio` deja el audio que reproduce `play_audio`."""
+        self.playback = PcmRingBuffer(
+            capacity_seconds=self.buffer_seconds,
+            rate=RECEIVE_SAMPLE_RATE,
+            period_frames=CHUNK_SIZE,
+            jitter_ms=self.jitter_ms,
+        )
         
     async def run(self):
         try:
             async with (
-                client.aio.live.connect(model=MODEL, config=CONFIG) as session,
+                (self.client or get_client()).aio.live.connect(model=self.model, config=self.config) as session,
                 asyncio.TaskGroup() as tg,
             ):
                 self.session = session
-                self.audio_in_queue = asyncio.Queue()
-                self.out_queue = asyncio.Queue(maxsize=5)
+                self.create_playback()
+                self.sender = SendPipeline(
+                    session.send,
+                    maxsize=self.out_queue_size,
+                    policy=self.send_policy,
+                    max_frame_chunks=self.max_frame_chunks,
+                    chunk_seconds=CHUNK_SIZE / SEND_SAMPLE_RATE,
+                    tracer=self.tracer,
+                )
 
                 tg.create_task(self.send_realtime())
                 tg.create_task(self.listen_audio())
@@ -123,13 +326,63 @@ class AudioLoop:
         except asyncio.CancelledError:
             pass
         except Exception as e:
-            self.audio_stream.close()
+            if self.audio_stream is not None:
+                self.audio_stream.close()
             traceback.print_exception(e)
         
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     # Se han eliminado los argumentos de modo (visión)
+    parser.add_argument("--trazas", default=None, metavar="FICHERO",
+                        help="Mide cada etapa y guarda las medidas en un fichero JSONL")
+    parser.add_argument("--metricas", type=int, default=None, metavar="PUERTO",
+                        help="Mide cada etapa y sirve las métricas en formato Prometheus en este puerto")
+    parser.add_argument("--vad", action="store_true", help="No envía los tramos de silencio del micrófono")
+    parser.add_argument("--vad-umbral", type=float, default=-50.0, metavar="DBFS",
+                        help="Nivel mínimo de voz en dBFS (por defecto -50)")
+    parser.add_argument("--politica-envio", choices=POLICIES, default="drop-silence-first",
+                        help="Qué hacer si la cola de envío se llena")
+    parser.add_argument("--agrupar", type=int, default=4, metavar="N",
+                        help="Trozos máximos por mensaje cuando el envío se retrasa (1 = sin agrupar)")
+    parser.add_argument("--audio", choices=("callback", "blocking"), default="callback",
+                        help="Modo de los streams de PyAudio")
+    parser.add_argument("--interrupcion", action="store_true",
+                        help="Corta la respuesta cuando el usuario empieza a hablar (mejor con auriculares: "
+                             "no hay cancelación de eco)")
+    parser.add_argument("--interrupcion-umbral", type=float, default=-35.0, metavar="DBFS",
+                        help="Nivel del micrófono que corta la respuesta (por defecto -35)")
     args = parser.parse_args()
-    main = AudioLoop()
-    asyncio.run(main.run())
+    tracer = Tracer(args.trazas) if args.trazas or args.metricas else None
+    vad = None
+    if args.vad:
+        # El fin de cada tramo de voz permite medir la latencia del modelo en las trazas.
+        vad = VoiceActivityDetector(min_db=args.vad_umbral,
+                                    on_speech_end=lambda at: main.tracer.mark("fin_usuario", at))
+    main = AudioLoop(tracer=tracer, vad=vad, send_policy=args.politica_envio, max_frame_chunks=args.agrupar,
+                     audio_backend=args.audio, barge_in=args.interrupcion,
+                     barge_in_db=args.interrupcion_umbral)
+
+    async def run():
+        server = await tracer.serve_metrics(port=args.metricas) if args.metricas else None
+        try:
+            await main.run()
+        finally:
+            if server is not None:
+                server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.tracer.report()
+        main.tracer.close()
+        if main.vad is not None:
+            main.vad.report()
+        if main.sender is not None:
+            main.sender.report()
+        if main.playback is not None:
+            main.playback.report()
+            main.report_barge_in()
+        main.audio_stats.report()
@@ -1,11 +1,15 @@
+import argparse
 import asyncio
 import contextlib
 import os
+import time
 import wave
 from dotenv import load_dotenv
 from google import genai
 import shutil
 from rag import Rag
+from response_cache import ResponseCache
+from startup import StartupTimer
 
 MODEL = "gemini-2.0-flash-exp"
 
@@ -78,11 +82,19 @@ config = {
     }
 }
 
-async def main():
-    rag = Rag('./libros/harrypotter_caliz.txt')
+async def main(similar=False):
+    # El modelo y el índice se preparan en segundo plano mientras se conecta la sesión.
+    timer = StartupTimer()
+    rag = Rag('./libros', background=True, timer=timer)
+    # Las preguntas repetidas reutilizan el audio ya generado. Con `similar` también las muy
+    # parecidas (con los mismos embeddings que usa rag), aunque la pregunta no sea la misma.
+    embed = (lambda query: rag.embed_queries([query])[0]) if similar else None
+    cache = ResponseCache(embed=embed)
     borrar_todos_los_audios('./audios')
     numero = 0
+    connect_started = time.perf_counter()
     async with client.aio.live.connect(model=MODEL, config=config) as session:
+        timer.record("conectar con la API Live", connect_started)
         
         while True:
             message = input("\nHablame--> ")
@@ -91,8 +103,20 @@ async def main():
             numero += 1
             file_name = f'./audios/audio_{numero}.wav'
             
-            # Obtener fragmentos relevantes
-            context_chunk = rag.get_chunk_relevates(message)
+            # Obtener fragmentos relevantes (la primera vez espera a que el índice esté listo)
+            if not rag.ready:
+                print("Preparando el índice de los libros...")
+                await rag.wait_ready_async()
+                timer.report()
+
+            # La caché puede calcular embeddings: se consulta en el hilo de rag.
+            if (hit := await rag.arun(cache.get, message)) is not None:
+                with wave_file(file_name) as wav:
+                    wav.writeframes(hit.audio)
+                print(f"Respuesta en caché ({hit.latency:.2f} s ahorrados)")
+                continue
+
+            context_chunk = await rag.aget_chunk_relevates(message)
             context = "\n".join(context_chunk)
             
             # Construir el prompt que se enviará a la API
@@ -107,20 +131,30 @@ async def main():
             """
             
             with wave_file(file_name) as wav:    
-                
+                started = time.perf_counter()
+                audio = bytearray()
                 await session.send(input=mensaje_con_contexto, end_of_turn=True)
 
                 turn = session.receive()
                 async for n,response in async_enumerate(turn):
                     if response.data is not None:
                         wav.writeframes(response.data)
+                        audio += response.data
 
                         if n==0:
                             print(response.server_content.model_turn.parts[0].inline_data.mime_type)
                         print('.', end='')
+            await rag.arun(cache.put, message, audio, time.perf_counter() - started)
+
+        cache.report()
 
 
     #display(Audio(file_name, autoplay=True)) # Esto es para mostrar el audio en el notebook
     
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-parecidas", action="store_true",
+                        help="Reutiliza también la respuesta de preguntas parecidas (similitud coseno >= 0.92), "
+                             "no sólo de las iguales; puede responder a una pregunta distinta")
+    args = parser.parse_args()
+    asyncio.run(main(args.cache_parecidas))
\ No newline at end of file
@@ -1,6 +1,7 @@
 import asyncio
 import os
 import sys
+import time
 import traceback
 
 import pyaudio
@@ -9,6 +10,8 @@ import argparse
 from google import genai
 from dotenv import load_dotenv
 from rag import Rag
+from loop_monitor import LoopLagMonitor
+from startup import StartupTimer
 
 if sys.version_info < (3, 11, 0):
     import taskgroup, exceptiongroup
@@ -48,11 +51,16 @@ CONFIG = {
 pya = pyaudio.PyAudio()
 
 class AudioLoop:
-    def __init__(self):
+    def __init__(self, sync_retrieval=False, timer=None):
         self.audio_in_queue = None
         self.out_queue = None
         self.session = None
         self.send_text_task = None
+        self.turn_task = None
+        # Si es True, rag se consulta en el propio bucle de eventos (comportamiento anterior).
+        self.sync_retrieval = sync_retrieval
+        self.lag_monitor = LoopLagMonitor()
+        self.timer = timer or StartupTimer()
         
     async def send_text(self):
         while True:
@@ -63,26 +71,41 @@ class AudioLoop:
             if text.lower() == "q":
                 break
             
-             # Obtener fragmentos relevantes
+            # Una pregunta nueva sustituye a la anterior si aún se está preparando.
+            if self.turn_task is not None and not self.turn_task.done():
+                self.turn_task.cancel()
+            self.turn_task = asyncio.create_task(self.send_turn(text))
+
+    async def send_turn(self, text):
+        """
+        Busca el contexto en rag sin bloquear el bucle de eventos y envía la pregunta a la sesión.
+        """
+        # Obtener fragmentos relevantes (si el índice aún se está preparando, la pregunta espera en cola)
+        if not rag.ready:
+            print("Preparando el índice de los libros, la pregunta se enviará en cuanto esté listo...")
+        if self.sync_retrieval:
             context_chunk = rag.get_chunk_relevates(text)
-            context = "\n".join(context_chunk)
+        else:
+            context_chunk = await rag.aget_chunk_relevates(text)
+        context = "\n".join(context_chunk)
             
-            # Construir el prompt que se enviará a la API
-            mensaje_con_contexto = f"""Eres un asistente de IA que responde basándote en el contexto proporcionado. Si no encuentras información relevante, responde honestamente.
+        # Construir el prompt que se enviará a la API
+        mensaje_con_contexto = f"""Eres un asistente de IA que responde basándote en el contexto proporcionado. Si no encuentras información relevante, responde honestamente.
 
-                Contexto:
-                {context}
+            Contexto:
+            {context}
 
-                Pregunta: {text}
+            Pregunta: {text}
 
-                Respuesta:
-            """
-            
-            
-            await self.session.send(input=mensaje_con_contexto or ".", end_of_turn=True)
+            Respuesta:
+        """
+        
+        
+        await self.session.send(input=mensaje_con_contexto or ".", end_of_turn=True)
         
     
     async def listen_audio(self):
+        started = time.perf_counter()
         mic_info = pya.get_default_input_device_info()
         self.audio_stream = await asyncio.to_thread(
             pya.open,
@@ -93,6 +116,7 @@ class AudioLoop:
             input_device_index=mic_info["index"],
             frames_per_buffer=CHUNK_SIZE,
         )
+        self.timer.record("abrir micrófono", started)
         # En modo debug se desactiva la excepción por overflow.
         kwargs = {"exception_on_overflow": False} if __debug__ else {}
         while True:
@@ -104,6 +128,22 @@ class AudioLoop:
             msg = await self.out_queue.get()
             await self.session.send(input=msg)
     
+    async def watch_books(self, interval=30):
+        """
+        Comprueba cada `interval` segundos si han cambiado los libros y, si es así,
+        actualiza el índice de rag sin cerrar la sesión en curso. Si la actualización
+        falla se sigue con el índice anterior y se vuelve a intentar en la siguiente vuelta.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = await asyncio.to_thread(rag.refresh)
+            except Exception as e:
+                print(f"\n[rag] No se ha podido actualizar el índice, se mantiene el anterior: {e!r}")
+                continue
+            if changes['added'] or changes['updated'] or changes['removed']:
+                print(f"\n[rag] Índice actualizado: {changes}")
+
     async def receive_audio(self):
         while True:
             turn = self.session.receive()
@@ -118,6 +158,7 @@ class AudioLoop:
                 self.audio_in_queue.get_nowait()
     
     async def play_audio(self):
+        started = time.perf_counter()
         stream = await asyncio.to_thread(
             pya.open,
             format=FORMAT,
@@ -125,16 +166,24 @@ class AudioLoop:
             rate=RECEIVE_SAMPLE_RATE,
             output=True,
         )
+        self.timer.record("abrir altavoz", started)
         while True:
             bytestream = await self.audio_in_queue.get()
             await asyncio.to_thread(stream.write, bytestream)    
         
+    async def report_startup(self):
+        """Muestra el desglose del arranque cuando el índice de rag está listo."""
+        await rag.wait_ready_async()
+        self.timer.report()
+
     async def run(self):
         try:
+            connect_started = time.perf_counter()
             async with (
                 client.aio.live.connect(model=MODEL, config=CONFIG) as session,
                 asyncio.TaskGroup() as tg,
             ):
+                self.timer.record("conectar con la API Live", connect_started)
                 self.session = session
                 self.audio_in_queue = asyncio.Queue()
                 self.out_queue = asyncio.Queue(maxsize=5)
@@ -143,7 +192,10 @@ class AudioLoop:
                 tg.create_task(self.send_realtime())
                 tg.create_task(self.listen_audio())
                 tg.create_task(self.receive_audio())
+                tg.create_task(self.watch_books())
                 tg.create_task(self.play_audio())
+                tg.create_task(self.lag_monitor.run())
+                tg.create_task(self.report_startup())
 
                 # Se mantiene la ejecución hasta que se cancele la tarea.
                 #await asyncio.Event().wait()
@@ -157,14 +209,20 @@ class AudioLoop:
         except Exception as e:
             self.audio_stream.close()
             traceback.print_exception(e)
+        finally:
+            self.lag_monitor.report()
         
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     # Se han eliminado los argumentos de modo (visión)
+    parser.add_argument("--rag-sincrono", action="store_true",
+                        help="Consulta rag dentro del bucle de eventos (como antes) para comparar el bloqueo.")
     args = parser.parse_args()
     
-    rag = Rag('./libros/harrypotter_caliz.txt')
+    # El modelo y el índice se preparan en segundo plano mientras se conecta la sesión.
+    timer = StartupTimer()
+    rag = Rag('./libros', background=True, timer=timer)
     
-    main = AudioLoop()
+    main = AudioLoop(sync_retrieval=args.rag_sincrono, timer=timer)
     asyncio.run(main.run())
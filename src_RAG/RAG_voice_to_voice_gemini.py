@@ -1,6 +1,7 @@
 import asyncio
 import os
 import sys
+import time
 import traceback
 import pyaudio
 import argparse
@@ -8,7 +9,10 @@ import argparse
 from google import genai
 from dotenv import load_dotenv
 from rag import Rag
-from stt import EasySpeechRecognizer
+from stt import BackgroundListener, EasySpeechRecognizer
+from loop_monitor import LoopLagMonitor
+from query_cache import normalize_query
+from startup import StartupTimer
 
 if sys.version_info < (3, 11, 0):
     import taskgroup, exceptiongroup
@@ -48,51 +52,148 @@ CONFIG = {
 pya = pyaudio.PyAudio()
 
 class AudioLoop:
-    def __init__(self):
+    def __init__(self, sync_retrieval=False, timer=None, stt_engine="google", streaming=True):
         self.audio_in_queue = None
         self.session = None
+        self.turn_task = None
+        # Si es True, rag se consulta en el propio bucle de eventos (comportamiento anterior).
+        self.sync_retrieval = sync_retrieval
+        self.lag_monitor = LoopLagMonitor()
+        self.timer = timer or StartupTimer()
+        self.stt_engine = stt_engine
+        # En streaming la búsqueda en rag empieza con los parciales estables (ver `speculate`).
+        self.streaming = streaming
+        self.speculative = {}
+        self.speculative_hits = 0
+        self.context_waits = []
+        self.listener = None
 
     async def listen_voice_command(self):
         """
         Utiliza EasySpeechRecognizer para capturar el audio del usuario, convierte la voz a texto,
-        obtiene fragmentos relevantes mediante rag y envía el mensaje a la API.
+        obtiene fragmentos relevantes mediante rag y envía el mensaje a la API. El micrófono
+        se abre una sola vez: mientras se reconoce una pregunta ya se está capturando la siguiente.
         """
         # Instancia y calibración del reconocedor
-        recognizer = EasySpeechRecognizer(energy_threshold=300, pause_threshold=1.0, dynamic_energy_threshold=True)
-        await asyncio.to_thread(recognizer.calibrate, duration=1)
+        recognizer = EasySpeechRecognizer(energy_threshold=300, pause_threshold=1.0, dynamic_energy_threshold=True,
+                                          engine=self.stt_engine)
+        loop = asyncio.get_running_loop()
+
+        def on_partial(partial, stable):
+            print(f"  ... {partial}")
+            if stable:
+                loop.call_soon_threadsafe(self.speculate, partial)
+
+        self.listener = BackgroundListener(recognizer, language="es-ES",
+                                           on_partial=on_partial if self.streaming else None)
+        started = time.perf_counter()
+        await asyncio.to_thread(self.listener.start, loop, calibrate=1)
+        self.timer.record("abrir y calibrar micrófono", started)
+        print("Habla ahora...")
         while True:
-            text = await asyncio.to_thread(recognizer.listen_and_recognize, language="es-ES")
+            text = await self.listener.get()
             if text is None:
-                continue
+                break
             if text.lower().strip() == "salir":
                 print("Saliendo... pulsa Ctrl+C")
+                await asyncio.to_thread(self.listener.stop)
                 break
 
-            # Obtener fragmentos relevantes (contexto) usando rag
+            # Una pregunta nueva sustituye a la anterior si aún se está preparando.
+            if self.turn_task is not None and not self.turn_task.done():
+                self.turn_task.cancel()
+            self.turn_task = asyncio.create_task(self.send_turn(text))
+
+    def speculate(self, partial):
+        """
+        Empieza a buscar en rag con un parcial estable, antes de que llegue el texto final;
+        se guardan las últimas 8 búsquedas.
+        """
+        key = normalize_query(partial)
+        if self.sync_retrieval or not rag.ready or key in self.speculative:
+            return
+        self.speculative[key] = asyncio.ensure_future(rag.aget_chunk_relevates(partial))
+        while len(self.speculative) > 8:
+            self.speculative.pop(next(iter(self.speculative))).cancel()
+
+    async def retrieve(self, text):
+        """Contexto para el texto final, reutilizando la búsqueda especulativa si coincide."""
+        key = normalize_query(text)
+        if key in self.speculative:
+            # Las búsquedas anteriores eran de parciales de esta misma pregunta; las
+            # posteriores pueden ser ya de la siguiente, que se está capturando a la vez.
+            keys = list(self.speculative)
+            for stale in keys[:keys.index(key)]:
+                self.speculative.pop(stale).cancel()
+        task = self.speculative.pop(key, None)
+        if task is not None:
+            self.speculative_hits += 1
+            return await task
+        return await rag.aget_chunk_relevates(text)
+
+    def report_speculation(self, label="búsqueda especulativa"):
+        """Muestra cuántas preguntas tenían ya el contexto y cuánto se esperó por él."""
+        if not self.context_waits:
+            return
+        waits = sorted(self.context_waits)
+        print(
+            f"\n[{label}] aciertos={self.speculative_hits}/{len(waits)} espera del contexto: "
+            f"media={1000 * sum(waits) / len(waits):.1f} ms máx={1000 * waits[-1]:.1f} ms"
+        )
+
+    async def send_turn(self, text):
+        """
+        Busca el contexto en rag sin bloquear el bucle de eventos y envía la pregunta a la sesión.
+        """
+        # Obtener fragmentos relevantes (contexto) usando rag; si el índice aún se está
+        # preparando, la pregunta espera en cola
+        if not rag.ready:
+            print("Preparando el índice de los libros, la pregunta se enviará en cuanto esté listo...")
+        started = time.perf_counter()
+        if self.sync_retrieval:
             context_chunk = rag.get_chunk_relevates(text)
-            context = "\n".join(context_chunk)
-
-            # Construir el prompt con contexto
-            mensaje_con_contexto = f"""Eres un asistente inteligente diseñado exclusivamente para apoyar lectores de libros de aventuras, 
-                para el analisis y hacer resumenes de los libros proporcionados. Ayudas a los usuarios siempre en Español 
-                y siempre dentro del contexto exclusivo de los libros de aventuras. Si no encuentras información relevante, responde honestamente.
-                
-                ### **Pautas Clase:**
-                **Responde eclusivamente en ESPAÑOL.** No respondas en otro idioma.
-                **Responde siempre dentro del contexto exclusivo de los libros de aventuras.**
-                **Si no encuentras información relevante, responde honestamente.**
-                **Si no entiendes la pregunta, responde honestamente.**
-                **Si no puedes responder, responde honestamente.**
-                **Cuando respondas, intenta ser lo más claro y conciso posible.**
-
-                Contexto:
-                {context}
-
-                Pregunta: {text}
-
-                Respuesta:"""
-            # Enviar el mensaje a la sesión
-            await self.session.send(input=mensaje_con_contexto or ".", end_of_turn=True)
+        else:
+            context_chunk = await self.retrieve(text)
+        self.context_waits.append(time.perf_counter() - started)
+        context = "\n".join(context_chunk)
+
+        # Construir el prompt con contexto
+        mensaje_con_contexto = f"""Eres un asistente inteligente diseñado exclusivamente para apoyar lectores de libros de aventuras, 
+            para el analisis y hacer resumenes de los libros proporcionados. Ayudas a los usuarios siempre en Español 
+            y siempre dentro del contexto exclusivo de los libros de aventuras. Si no encuentras información relevante, responde honestamente.
+            
+            ### **Pautas Clase:**
+            **Responde eclusivamente en ESPAÑOL.** No respondas en otro idioma.
+            **Responde siempre dentro del contexto exclusivo de los libros de aventuras.**
+            **Si no encuentras información relevante, responde honestamente.**
+            **Si no entiendes la pregunta, responde honestamente.**
+            **Si no puedes responder, responde honestamente.**
+            **Cuando respondas, intenta ser lo más claro y conciso posible.**
+
+            Contexto:
+            {context}
+
+            Pregunta: {text}
+
+            Respuesta:"""
+        # Enviar el mensaje a la sesión
+        await self.session.send(input=mensaje_con_contexto or ".", end_of_turn=True)
+
+    async def watch_books(self, interval=30):
+        """
+        Comprueba cada `interval` segundos si han cambiado los libros y, si es así,
+        actualiza el índice de rag sin cerrar la sesión en curso. Si la actualización
+        falla se sigue con el índice anterior y se vuelve a intentar en la siguiente vuelta.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = await asyncio.to_thread(rag.refresh)
+            except Exception as e:
+                print(f"\n[rag] No se ha podido actualizar el índice, se mantiene el anterior: {e!r}")
+                continue
+            if changes['added'] or changes['updated'] or changes['removed']:
+                print(f"\n[rag] Índice actualizado: {changes}")
 
     async def receive_audio(self):
         """
@@ -115,6 +216,7 @@ class AudioLoop:
         """
         Reproduce el audio recibido a través de un stream de PyAudio.
         """
+        started = time.perf_counter()
         stream = await asyncio.to_thread(
             pya.open,
             format=FORMAT,
@@ -122,16 +224,24 @@ class AudioLoop:
             rate=RECEIVE_SAMPLE_RATE,
             output=True,
         )
+        self.timer.record("abrir altavoz", started)
         while True:
             bytestream = await self.audio_in_queue.get()
             await asyncio.to_thread(stream.write, bytestream)
 
+    async def report_startup(self):
+        """Muestra el desglose del arranque cuando el índice de rag está listo."""
+        await rag.wait_ready_async()
+        self.timer.report()
+
     async def run(self):
         try:
+            connect_started = time.perf_counter()
             async with (
                 client.aio.live.connect(model=MODEL, config=CONFIG) as session,
                 asyncio.TaskGroup() as tg,
             ):
+                self.timer.record("conectar con la API Live", connect_started)
                 self.session = session
                 self.audio_in_queue = asyncio.Queue()
 
@@ -139,7 +249,10 @@ class AudioLoop:
                 tg.create_task(self.listen_voice_command())
                 # Se crean tareas para recibir y reproducir la respuesta (audio)
                 tg.create_task(self.receive_audio())
+                tg.create_task(self.watch_books())
                 tg.create_task(self.play_audio())
+                tg.create_task(self.lag_monitor.run())
+                tg.create_task(self.report_startup())
 
                 # Espera hasta que listen_voice_command finalice (p.ej., al escribir "q")
                 await asyncio.Event().wait()
@@ -148,13 +261,27 @@ class AudioLoop:
             pass
         except Exception as e:
             traceback.print_exception(e)
+        finally:
+            self.lag_monitor.report()
+            self.report_speculation()
+            if self.listener is not None:
+                self.listener.report()
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     # Se han eliminado los argumentos de modo (visión)
+    parser.add_argument("--rag-sincrono", action="store_true",
+                        help="Consulta rag dentro del bucle de eventos (como antes) para comparar el bloqueo.")
+    parser.add_argument("--stt", choices=("google", "sphinx"), default="google",
+                        help="Motor de reconocimiento de voz (sphinx funciona sin red)")
+    parser.add_argument("--sin-parciales", action="store_true",
+                        help="Reconoce sólo al terminar de hablar, sin parciales ni búsqueda especulativa")
     args = parser.parse_args()
     
-    rag = Rag('./libros/harrypotter_caliz.txt')
+    # El modelo y el índice se preparan en segundo plano mientras se conecta la sesión.
+    timer = StartupTimer()
+    rag = Rag('./libros', background=True, timer=timer)
     
-    main = AudioLoop()
+    main = AudioLoop(sync_retrieval=args.rag_sincrono, timer=timer, stt_engine=args.stt,
+                     streaming=not args.sin_parciales)
     asyncio.run(main.run())
@@ -0,0 +1,111 @@
+import re
+from collections import deque
+from itertools import islice
+
+# Fin de frase (., !, ?, … seguidos de espacio) o salto de párrafo (línea en blanco).
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n\s*\n')
+WORD = re.compile(r'\S+')
+
+
+def _words(text, base):
+    # Palabras de `text` y la posición en el documento de cada una.
+    offsets, words = [], []
+    for match in WORD.finditer(text):
+        offsets.append(base + match.start())
+        words.append(match.group())
+    return offsets, words
+
+
+def iter_sentences(file_path, block_size=1 << 16, max_pending=1 << 20, encoding='utf-8'):
+    """
+    Lee un archivo por bloques y genera sus frases sin cargarlo entero en memoria.
+
+    Args:
+        file_path (str): Ruta del archivo de texto.
+        block_size (int, opcional): Caracteres leídos en cada bloque. Por defecto 64 Ki.
+        max_pending (int, opcional): Tamaño máximo del texto pendiente sin fin de frase;
+            si se supera se corta por el último espacio. Por defecto 1 Mi.
+        encoding (str, opcional): Codificación del archivo. Por defecto 'utf-8'.
+
+    Yields:
+        Tuple[List[int], List[str]]: Posición (en caracteres) de cada palabra de la frase y sus palabras.
+    """
+    pending = ''
+    base = 0  # posición en el documento del primer carácter de `pending`
+    with open(file_path, 'r', encoding=encoding) as file:
+        while block := file.read(block_size):
+            pending += block
+            start = 0
+            for match in SENTENCE_BOUNDARY.finditer(pending):
+                # Un separador al final del bloque puede continuar en el siguiente.
+                if match.end() == len(pending):
+                    break
+                offsets, words = _words(pending[start:match.start()], base + start)
+                if words:
+                    yield offsets, words
+                start = match.end()
+            if start == 0 and len(pending) > max_pending:
+                start = pending.rfind(' ', 0, max_pending) + 1 or max_pending
+                offsets, words = _words(pending[:start], base)
+                if words:
+                    yield offsets, words
+            pending = pending[start:]
+            base += start
+    offsets, words = _words(pending, base)
+    if words:
+        yield offsets, words
+
+
+def iter_fragments(file_path, max_length=500, overlap=0, **kwargs):
+    """
+    Agrupa frases consecutivas en fragmentos de como mucho `max_length` palabras
+    sin partir frases (salvo las que por sí solas superan el límite, que se
+    parten por palabras).
+
+    Args:
+        file_path (str): Ruta del archivo de texto.
+        max_length (int, opcional): Número máximo de palabras por fragmento. Por defecto 500.
+        overlap (int, opcional): Palabras máximas de las últimas frases de un fragmento que se
+            repiten al inicio del siguiente. Por defecto 0.
+        **kwargs: Se pasan a `iter_sentences`.
+
+    Yields:
+        Tuple[int, str]: Posición de inicio (en caracteres) y texto del fragmento.
+    """
+    if not 0 <= overlap < max_length:
+        raise ValueError("overlap debe estar entre 0 y max_length - 1")
+    current = deque()  # (posición, palabras) de las frases del fragmento en curso
+    length = 0
+    fresh = False  # si `current` tiene frases que aún no se han emitido
+    for offsets, words in iter_sentences(file_path, **kwargs):
+        for i in range(0, len(words), max_length):
+            piece = words[i:i + max_length]
+            if current and length + len(piece) > max_length:
+                yield current[0][0], ' '.join(word for _, sentence in current for word in sentence)
+                # Se conservan las últimas frases que caben en el solapamiento.
+                keep = min(overlap, max_length - len(piece))
+                while current and length > keep:
+                    length -= len(current.popleft()[1])
+                fresh = False
+            # Cada trozo de una frase larga empieza en la posición de su primera palabra.
+            current.append((offsets[i], piece))
+            length += len(piece)
+            fresh = True
+    if fresh:
+        yield current[0][0], ' '.join(word for _, sentence in current for word in sentence)
+
+
+def batched(iterable, size):
+    """
+    Agrupa un iterable en listas de como mucho `size` elementos.
+
+    Args:
+        iterable (Iterable): Elementos a agrupar.
+        size (int): Tamaño máximo de cada lote.
+
+    Yields:
+        List: Lotes consecutivos.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
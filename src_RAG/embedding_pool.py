@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from vector_index import normalize
+
+# Modelo cargado en cada proceso del pool (uno por proceso).
+_worker_model = None
+
+
+def encode_batch(model, texts):
+    """
+    Calcula los embeddings normalizados de un lote. Es la única forma de codificar
+    que usan tanto el camino secuencial como el paralelo: el lote se pasa entero
+    al modelo (`batch_size=len(texts)`), así el relleno no depende de quién lo
+    procese. Los procesos del pool usan menos hilos de torch que el proceso
+    principal y el orden de las sumas puede cambiar, por lo que los embeddings
+    coinciden salvo por el redondeo en coma flotante, no bit a bit.
+
+    Args:
+        model (SentenceTransformer): Modelo de embeddings.
+        texts (List[str]): Fragmentos del lote.
+
+    Returns:
+        np.ndarray: Embeddings normalizados, forma (len(texts), d).
+    """
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return normalize(model.encode(texts, batch_size=len(texts)))
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Evita que cada proceso use todos los núcleos y se pisen entre ellos.
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_in_worker(texts):
+    return encode_batch(_worker_model, texts)
+
+
+class BuildProgress:
+    """Cuenta fragmentos procesados e informa del ritmo (fragmentos/s) periódicamente."""
+
+    def __init__(self, label, interval=2.0, enabled=True):
+        """
+        Args:
+            label (str): Texto que identifica la construcción en los mensajes.
+            interval (float, opcional): Segundos mínimos entre mensajes. Por defecto 2.
+            enabled (bool, opcional): Si False no se imprime nada. Por defecto True.
+        """
+        self.label = label
+        self.interval = interval
+        self.enabled = enabled
+        self.count = 0
+        self.start = time.perf_counter()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """Fragmentos por segundo desde el inicio."""
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n):
+        """Suma `n` fragmentos y, si ha pasado `interval`, muestra el progreso."""
+        with self._lock:
+            self.count += n
+            now = time.perf_counter()
+            if self.enabled and now - self._last_report >= self.interval:
+                self._last_report = now
+                print(f"[rag] {self.label}: {self.count} fragmentos, {self.rate:.1f} fragmentos/s")
+
+    def finish(self):
+        """Muestra el resumen final."""
+        if self.enabled:
+            elapsed = time.perf_counter() - self.start
+            print(f"[rag] {self.label}: {self.count} fragmentos en {elapsed:.1f} s ({self.rate:.1f} fragmentos/s)")
+
+
+class EmbeddingPool:
+    """
+    Reparte lotes de fragmentos entre varios procesos, cada uno con su propia
+    copia del modelo, y devuelve los embeddings en el mismo orden de entrada.
+    """
+
+    def __init__(self, model_name, workers=None, threads=None):
+        """
+        Args:
+            model_name (str): Nombre del modelo de embeddings.
+            workers (int, opcional): Número de procesos. Por defecto, el número de núcleos.
+            threads (int, opcional): Hilos de torch por proceso. Por defecto se reparten los núcleos.
+        """
+        cpus = os.cpu_count() or 1
+        self.workers = max(1, workers or cpus)
+        # "spawn" en vez de fork: el proceso principal ya tiene hilos (torch, carga en
+        # segundo plano) y un fork puede heredar sus cerrojos tomados.
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, threads or max(1, cpus // self.workers)),
+        )
+
+    def map(self, batches, get_texts=None, max_pending=None):
+        """
+        Codifica lotes en paralelo manteniendo un número acotado de lotes en vuelo,
+        para que la memoria no crezca con el tamaño del documento.
+
+        Args:
+            batches (Iterable): Lotes a codificar.
+            get_texts (Callable, opcional): Extrae la lista de textos de cada lote. Por defecto
+                el propio lote es la lista de textos.
+            max_pending (int, opcional): Lotes en vuelo como máximo. Por defecto 2 por proceso.
+
+        Yields:
+            Tuple[Any, np.ndarray]: Cada lote junto con sus embeddings, en el orden de entrada.
+        """
+        max_pending = max_pending or 2 * self.workers
+        pending = deque()
+        for batch in batches:
+            texts = get_texts(batch) if get_texts else batch
+            pending.append((batch, self.executor.submit(_encode_in_worker, texts)))
+            if len(pending) >= max_pending:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+    def close(self):
+        """Termina los procesos del pool."""
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from lexical import BM25Builder, BM25Index
+
+# Versión del formato en disco. Se incrementa cada vez que cambia la forma de
+# trocear o de guardar los embeddings, para no reutilizar índices incompatibles.
+INDEX_VERSION = 6
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo leyéndolo por bloques.
+
+    Args:
+        file_path (str): Ruta del archivo.
+        block_size (int, opcional): Tamaño de bloque en bytes. Por defecto 1 MiB.
+
+    Returns:
+        str: Hash hexadecimal del contenido.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while block := file.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_key(content_hash, model_name, max_length, overlap=0):
+    """
+    Construye la clave del índice a partir de todo lo que afecta a su contenido.
+
+    Args:
+        content_hash (str): Hash del contenido del documento.
+        model_name (str): Nombre del modelo de embeddings.
+        max_length (int): Número máximo de palabras por fragmento.
+        overlap (int, opcional): Solapamiento en palabras entre fragmentos. Por defecto 0.
+
+    Returns:
+        str: Clave estable que se usa como nombre del directorio del índice.
+    """
+    raw = json.dumps([INDEX_VERSION, content_hash, model_name, max_length, overlap])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def index_exists(cache_dir, key):
+    """
+    Comprueba si hay un índice completo y de la versión actual sin cargarlo: sólo
+    lee meta.json, que es lo último que se escribe.
+
+    Args:
+        cache_dir (str): Directorio raíz de la caché.
+        key (str): Clave del índice (ver `index_key`).
+
+    Returns:
+        bool: True si el índice existe.
+    """
+    try:
+        with open(os.path.join(cache_dir, key, 'meta.json'), 'r', encoding='utf-8') as file:
+            return json.load(file).get('version') == INDEX_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+def load_index(cache_dir, key):
+    """
+    Carga un índice guardado previamente. Los embeddings se abren como memoria
+    mapeada, por lo que la carga no lee la matriz completa.
+
+    Args:
+        cache_dir (str): Directorio raíz de la caché.
+        key (str): Clave del índice (ver `index_key`).
+
+    Returns:
+        Tuple[List[str], np.ndarray, np.ndarray, BM25Index] | None: Fragmentos, posiciones de inicio,
+        embeddings e índice léxico, o None si no existe o el índice no es válido.
+    """
+    index_dir = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta.get('version') != INDEX_VERSION:
+            return None
+        count, dim = meta['count'], meta['dim']
+        with open(os.path.join(index_dir, 'fragments.jsonl'), 'r', encoding='utf-8') as file:
+            fragments = [json.loads(line) for line in file]
+        offsets = np.fromfile(os.path.join(index_dir, 'offsets.i64'), dtype=np.int64)
+        if count == 0:
+            embeddings = np.empty((0, dim), dtype=np.float32)
+        else:
+            embeddings = np.memmap(os.path.join(index_dir, 'embeddings.f32'), dtype=np.float32,
+                                   mode='r', shape=(count, dim))
+        lexical = BM25Index.load(index_dir)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not len(fragments) == len(offsets) == len(lexical) == count:
+        return None
+    return fragments, offsets, embeddings, lexical
+
+
+def remove_index(cache_dir, key):
+    """
+    Borra un índice de la caché (p. ej. uno dañado antes de reconstruirlo).
+
+    Args:
+        cache_dir (str): Directorio raíz de la caché.
+        key (str): Clave del índice (ver `index_key`).
+    """
+    shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+
+
+def prune_indexes(cache_dir, source, keep=(), **params):
+    """
+    Borra los índices de versiones anteriores de un documento: los de la caché con
+    el mismo `source` y los mismos parámetros (`params`, p. ej. modelo y troceado)
+    cuya clave no esté en `keep`. Si un directorio no se puede borrar (p. ej. en
+    Windows mientras está mapeado en memoria) se deja para la próxima vez.
+
+    Args:
+        cache_dir (str): Directorio raíz de la caché.
+        source (str): Nombre del documento.
+        keep (Collection[str], opcional): Claves que se conservan.
+        **params: Valores de meta.json que deben coincidir.
+
+    Returns:
+        int: Directorios borrados.
+    """
+    removed = 0
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+    for name in names:
+        # Los directorios que empiezan por '.' son índices a medio escribir.
+        if name in keep or name.startswith('.'):
+            continue
+        try:
+            with open(os.path.join(cache_dir, name, 'meta.json'), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if meta.get('source') == source and all(meta.get(k) == v for k, v in params.items()):
+            path = os.path.join(cache_dir, name)
+            shutil.rmtree(path, ignore_errors=True)
+            removed += not os.path.exists(path)
+    return removed
+
+
+class IndexWriter:
+    """
+    Escribe un índice en disco por lotes, sin necesitar todos los embeddings en
+    memoria. A la vez se construye el índice léxico BM25 de los fragmentos.
+    Todo se escribe en un directorio temporal que se renombra en `commit`, así
+    un proceso concurrente nunca ve un índice a medio escribir.
+
+    Ejemplo:
+        with IndexWriter(cache_dir, key, dim) as writer:
+            writer.add(fragments, offsets, embeddings)
+    """
+
+    def __init__(self, cache_dir, key, dim, **meta):
+        """
+        Args:
+            cache_dir (str): Directorio raíz de la caché.
+            key (str): Clave del índice (ver `index_key`).
+            dim (int): Dimensión de los embeddings.
+            **meta: Información adicional que se guarda en meta.json.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_dir = os.path.join(cache_dir, key)
+        self.tmp_dir = tempfile.mkdtemp(prefix=f'.{key}-', dir=cache_dir)
+        self.dim = dim
+        self.meta = meta
+        self.count = 0
+        self.lexical = BM25Builder()
+        self._fragments = open(os.path.join(self.tmp_dir, 'fragments.jsonl'), 'w', encoding='utf-8')
+        self._offsets = open(os.path.join(self.tmp_dir, 'offsets.i64'), 'wb')
+        self._embeddings = open(os.path.join(self.tmp_dir, 'embeddings.f32'), 'wb')
+
+    def add(self, fragments, offsets, embeddings):
+        """
+        Añade un lote de fragmentos al índice.
+
+        Args:
+            fragments (Sequence[str]): Fragmentos de texto.
+            offsets (Sequence[int]): Posición de inicio de cada fragmento en el documento.
+            embeddings (np.ndarray): Embeddings normalizados del lote, forma (n, dim).
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if not len(fragments) == len(offsets) == embeddings.shape[0]:
+            raise ValueError("fragments, offsets y embeddings deben tener la misma longitud")
+        for fragment in fragments:
+            self._fragments.write(json.dumps(fragment, ensure_ascii=False) + '\n')
+        self._offsets.write(np.asarray(offsets, dtype=np.int64).tobytes())
+        self._embeddings.write(embeddings.tobytes())
+        self.lexical.add(fragments)
+        self.count += len(fragments)
+
+    def _close(self):
+        for file in (self._fragments, self._offsets, self._embeddings):
+            file.close()
+
+    def commit(self):
+        """Cierra los archivos y publica el índice en su directorio definitivo."""
+        self._close()
+        self.lexical.build().save(self.tmp_dir)
+        # meta.json se escribe el último: marca el índice como completo.
+        with open(os.path.join(self.tmp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_VERSION, 'count': self.count, 'dim': self.dim, **self.meta}, file)
+        try:
+            os.replace(self.tmp_dir, self.index_dir)
+        except OSError:
+            # Otro proceso ya ha guardado el mismo índice.
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        """Descarta el índice a medio escribir."""
+        self._close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
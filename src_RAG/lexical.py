@@ -0,0 +1,243 @@
+import json
+import os
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+from vector_index import top_k_rows
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# Palabras vacías del español (sin tildes, igual que los tokens).
+SPANISH_STOPWORDS = frozenset('''
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada como con contra cual
+cuales cuando de del desde donde dos durante e el ella ellas ello ellos en entre era eran es esa esas ese eso
+esos esta estaba estan estar estas este esto estos fue fueron ha habia han hasta hay la las le les lo los mas
+me mi mis mucho muy nada ni no nos nosotros o os otra otras otro otros para pero poco por porque que quien
+quienes se sea segun ser si sido sin sobre solo son su sus tambien tan te tiene tienen todo todos tu tus un
+una unas uno unos y ya yo
+'''.split())
+
+
+def tokenize(text, stopwords=SPANISH_STOPWORDS):
+    """
+    Divide un texto en términos: minúsculas, sin tildes ni diéresis (la ñ queda
+    como n), sin signos como ¿ ¡ y sin palabras vacías. Así "¿Quién es Cedric?"
+    y "quien es cedric" dan los mismos términos.
+
+    Args:
+        text (str): Texto a tokenizar.
+        stopwords (Collection[str], opcional): Palabras que se descartan. Por defecto las del español.
+
+    Returns:
+        List[str]: Términos del texto.
+    """
+    text = unicodedata.normalize('NFKD', text.casefold()).encode('ascii', 'ignore').decode('ascii')
+    return [token for token in _TOKEN.findall(text) if token not in stopwords]
+
+
+class BM25Builder:
+    """Acumula fragmentos por lotes y genera un `BM25Index` sin guardar los textos."""
+
+    def __init__(self):
+        self.vocab = {}
+        self.doc_lengths = array('i')
+        self._terms = array('i')
+        self._docs = array('i')
+        self._tfs = array('i')
+
+    def add(self, fragments):
+        """
+        Añade fragmentos al índice, en orden.
+
+        Args:
+            fragments (Iterable[str]): Textos de los fragmentos.
+        """
+        for text in fragments:
+            doc_id = len(self.doc_lengths)
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                term_id = self.vocab.setdefault(token, len(self.vocab))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            self._terms.extend(counts.keys())
+            self._docs.extend([doc_id] * len(counts))
+            self._tfs.extend(counts.values())
+            self.doc_lengths.append(len(tokens))
+
+    def build(self, **options):
+        """
+        Genera el índice invertido en formato CSR: las listas de cada término son
+        rebanadas contiguas de arrays de NumPy.
+
+        Args:
+            **options: Parámetros de `BM25Index` (`k1`, `b`).
+
+        Returns:
+            BM25Index: Índice listo para consultar.
+        """
+        terms = np.frombuffer(self._terms, dtype=np.int32)
+        order = np.argsort(terms, kind='stable')
+        indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocab)), out=indptr[1:])
+        return BM25Index(
+            vocab=self.vocab,
+            indptr=indptr,
+            doc_ids=np.frombuffer(self._docs, dtype=np.int32)[order],
+            tfs=np.minimum(np.frombuffer(self._tfs, dtype=np.int32)[order], 65535).astype(np.uint16),
+            doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.int32).copy(),
+            **options,
+        )
+
+
+class BM25Index:
+    """Índice invertido BM25 con listas de apariciones guardadas en arrays compactos."""
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, doc_lengths, k1=1.5, b=0.75):
+        """
+        Args:
+            vocab (Dict[str, int]): Término -> identificador.
+            indptr (np.ndarray): Inicio de la lista de cada término en `doc_ids`/`tfs` (CSR).
+            doc_ids (np.ndarray): Fragmentos en los que aparece cada término.
+            tfs (np.ndarray): Frecuencia del término en cada fragmento.
+            doc_lengths (np.ndarray): Número de términos de cada fragmento.
+            k1 (float, opcional): Saturación de la frecuencia. Por defecto 1.5.
+            b (float, opcional): Normalización por longitud. Por defecto 0.75.
+        """
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lengths)
+        self.total_length = int(doc_lengths.sum())
+        avgdl = self.total_length / n if n else 1.0
+        # Denominador de BM25 sin la frecuencia, precalculado por fragmento.
+        self._norms = (k1 * (1 - b + b * doc_lengths / max(avgdl, 1e-9))).astype(np.float32)
+        df = np.diff(indptr)
+        self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def doc_frequency(self, token):
+        """Número de fragmentos en los que aparece un término ya tokenizado."""
+        if (term_id := self.vocab.get(token)) is None:
+            return 0
+        return int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+    def scores(self, query, stats=None):
+        """
+        Puntuación BM25 de cada fragmento para una consulta.
+
+        Args:
+            query (str): Consulta en texto libre.
+            stats (CorpusStats, opcional): IDF y longitud media de varios índices juntos; con
+                ellas las puntuaciones se pueden comparar entre índices. Por defecto las propias.
+
+        Returns:
+            np.ndarray: Puntuaciones (n,); 0 para fragmentos sin términos de la consulta.
+        """
+        docs, weights = [], []
+        for token in set(tokenize(query)):
+            if (term_id := self.vocab.get(token)) is None:
+                continue
+            start, stop = self.indptr[term_id], self.indptr[term_id + 1]
+            ids = self.doc_ids[start:stop]
+            tfs = self.tfs[start:stop].astype(np.float32)
+            if stats is None:
+                idf, norms = self._idf[term_id], self._norms[ids]
+            else:
+                idf = stats.idf(token)
+                norms = self.k1 * (1 - self.b + self.b * self.doc_lengths[ids] / stats.avgdl)
+            docs.append(ids)
+            weights.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+        if not docs:
+            return np.zeros(len(self), dtype=np.float32)
+        return np.bincount(np.concatenate(docs), np.concatenate(weights), minlength=len(self)).astype(np.float32)
+
+    def search(self, query, top_k, stats=None):
+        """
+        Devuelve los fragmentos con mayor puntuación BM25.
+
+        Args:
+            query (str): Consulta en texto libre.
+            top_k (int): Número de resultados.
+            stats (CorpusStats, opcional): Estadísticas comunes a varios índices (ver `scores`).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Puntuaciones e índices, de mayor a menor. Sólo se
+            incluyen fragmentos con puntuación positiva.
+        """
+        scores, ids = top_k_rows(self.scores(query, stats)[None, :], top_k)
+        keep = scores[0] > 0
+        return scores[0][keep], ids[0][keep]
+
+    def save(self, index_dir):
+        """Guarda el índice en `index_dir` (bm25.npz y vocab.json)."""
+        np.savez(os.path.join(index_dir, 'bm25.npz'), indptr=self.indptr, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_lengths=self.doc_lengths, params=np.array([self.k1, self.b]))
+        with open(os.path.join(index_dir, 'vocab.json'), 'w', encoding='utf-8') as file:
+            json.dump(sorted(self.vocab, key=self.vocab.get), file)
+
+    @classmethod
+    def load(cls, index_dir):
+        """Carga un índice guardado con `save`."""
+        with open(os.path.join(index_dir, 'vocab.json'), 'r', encoding='utf-8') as file:
+            vocab = {term: i for i, term in enumerate(json.load(file))}
+        with np.load(os.path.join(index_dir, 'bm25.npz')) as data:
+            k1, b = data['params']
+            return cls(vocab, data['indptr'], data['doc_ids'], data['tfs'], data['doc_lengths'],
+                       k1=float(k1), b=float(b))
+
+
+class CorpusStats:
+    """
+    Estadísticas BM25 de varios índices como si fueran uno solo: número de
+    fragmentos, longitud media e IDF de cada término con la frecuencia de
+    documento sumada. Cada documento tiene su propio `BM25Index`, y con sus IDF
+    locales un término raro en un libro pero común en otro puntuaría distinto
+    según el libro; con estas estadísticas las puntuaciones de todos los índices
+    son las de un único BM25 sobre el corpus y se pueden ordenar juntas.
+    """
+
+    def __init__(self, indexes):
+        """
+        Args:
+            indexes (Iterable[BM25Index]): Índices del corpus.
+        """
+        self.indexes = list(indexes)
+        self.n = sum(len(index) for index in self.indexes)
+        total_length = sum(index.total_length for index in self.indexes)
+        self.avgdl = max(total_length / self.n if self.n else 1.0, 1e-9)
+        self._idf = {}
+
+    def idf(self, token):
+        """IDF de un término ya tokenizado en el conjunto de los índices."""
+        if (idf := self._idf.get(token)) is None:
+            df = sum(index.doc_frequency(token) for index in self.indexes)
+            idf = self._idf[token] = np.float32(np.log1p((self.n - df + 0.5) / (df + 0.5)))
+        return idf
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Combina varias listas ordenadas con Reciprocal Rank Fusion: cada elemento
+    suma 1 / (k + posición) por cada lista en la que aparece.
+
+    Args:
+        rankings (Iterable[Sequence[int]]): Listas de identificadores, de mejor a peor.
+        k (int, opcional): Constante de suavizado. Por defecto 60.
+
+    Returns:
+        List[Tuple[int, float]]: (identificador, puntuación), de mayor a menor puntuación.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])
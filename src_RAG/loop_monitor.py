@@ -0,0 +1,62 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LoopLagMonitor:
+    """
+    Mide cuánto tiempo está bloqueado el bucle de eventos: duerme `interval`
+    segundos una y otra vez y anota cuánto se retrasa cada despertar. Un
+    retraso grande significa que algo (p. ej. una búsqueda síncrona en rag) ha
+    ocupado el bucle y ha parado la reproducción y el envío de audio.
+
+    Ejemplo:
+        monitor = LoopLagMonitor()
+        tg.create_task(monitor.run())
+        ...
+        monitor.report()
+    """
+
+    def __init__(self, interval=0.01, block_threshold=0.05, max_samples=60000):
+        """
+        Args:
+            interval (float, opcional): Segundos entre comprobaciones. Por defecto 0.01.
+            block_threshold (float, opcional): Retraso (s) a partir del cual se cuenta como bloqueo.
+                Por defecto 0.05.
+            max_samples (int, opcional): Muestras recientes que se guardan para los percentiles.
+        """
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.samples = deque(maxlen=max_samples)
+        self.blocked_time = 0.0
+        self.blocks = 0
+        self.max_lag = 0.0
+
+    async def run(self):
+        """Bucle de medida; se ejecuta hasta que se cancela la tarea."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.block_threshold:
+                self.blocks += 1
+                self.blocked_time += lag
+
+    def percentile(self, q):
+        """Retraso (s) del percentil `q` (0-100) de las muestras tomadas."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def report(self, label="bucle de eventos"):
+        """Muestra un resumen de los retrasos medidos."""
+        print(
+            f"\n[{label}] muestras={len(self.samples)} "
+            f"p50={self.percentile(50) * 1000:.1f} ms p95={self.percentile(95) * 1000:.1f} ms "
+            f"p99={self.percentile(99) * 1000:.1f} ms máx={self.max_lag * 1000:.1f} ms "
+            f"bloqueos(>{self.block_threshold * 1000:.0f} ms)={self.blocks} "
+            f"tiempo bloqueado={self.blocked_time:.2f} s"
+        )
@@ -0,0 +1,64 @@
+import re
+import threading
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r'[¿?¡!.,;:"«»“”]+')
+
+
+def normalize_query(query):
+    """
+    Normaliza una consulta para usarla como clave de caché: minúsculas, sin
+    signos de puntuación y con los espacios compactados. Así "¿Quién es Cedric?"
+    y "quién es  cedric" comparten entrada.
+
+    Args:
+        query (str): Consulta original.
+
+    Returns:
+        str: Consulta normalizada.
+    """
+    return ' '.join(_PUNCTUATION.sub(' ', query.casefold()).split())
+
+
+class LRUCache:
+    """Caché acotada que descarta la entrada usada hace más tiempo. Es segura entre hilos."""
+
+    def __init__(self, maxsize=256):
+        """
+        Args:
+            maxsize (int, opcional): Número máximo de entradas. 0 desactiva la caché. Por defecto 256.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Devuelve el valor de `key` (marcándolo como reciente) o `default`."""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        """Guarda `value` y descarta la entrada más antigua si se supera `maxsize`."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._data.clear()
@@ -1,67 +1,662 @@
+import asyncio
+import functools
+import glob
+import hashlib
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+from chunker import batched, iter_fragments
+from embedding_pool import BuildProgress, EmbeddingPool, encode_batch
+from query_cache import LRUCache, normalize_query
+from index_store import (IndexWriter, file_sha256, index_exists, index_key, load_index, prune_indexes,
+                         remove_index)
+from lexical import BM25Builder, CorpusStats, reciprocal_rank_fusion
+from startup import StartupTimer
+from vector_index import make_index, normalize
+
+
+def fragment_hash(text):
+    """Hash del texto de un fragmento; identifica fragmentos que no cambian entre versiones."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Shard:
+    """
+    Índice de un único documento del corpus. Los datos se cargan la primera vez
+    que se consultan, así añadir un libro no retrasa el arranque de los demás.
+    """
+
+    def __init__(self, source, loader, index_kind='exact', index_options=None, path=None, content_hash=None,
+                 stat=None):
+        """
+        Args:
+            source (str): Nombre del documento (se usa para filtrar consultas).
+            loader (Callable): Función sin argumentos que devuelve (fragmentos, posiciones, embeddings,
+                índice léxico).
+            index_kind (str, opcional): Tipo de índice vectorial. Por defecto 'exact'.
+            index_options (dict, opcional): Parámetros del índice vectorial.
+            path (str, opcional): Ruta del documento.
+            content_hash (str, opcional): Hash del contenido indexado.
+            stat (Tuple[int, int], opcional): (mtime_ns, tamaño) del documento al indexarlo.
+        """
+        self.source = source
+        self.path = path
+        self.content_hash = content_hash
+        self.stat = stat
+        self._loader = loader
+        self._index_kind = index_kind
+        self._index_options = index_options or {}
+        self._lock = threading.Lock()
+        self._data = None
+
+    def load(self):
+        """Carga fragmentos, embeddings e índices si todavía no están en memoria."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    fragments, offsets, embeddings, lexical = self._loader()
+                    index = make_index(self._index_kind, embeddings, **self._index_options)
+                    self._data = (fragments, offsets, embeddings, index, lexical)
+        return self._data
+
+    @property
+    def fragments(self):
+        return self.load()[0]
+
+    @property
+    def offsets(self):
+        return self.load()[1]
+
+    @property
+    def embeddings(self):
+        return self.load()[2]
+
+    @property
+    def lexical(self):
+        return self.load()[4]
+
+    def changed_on_disk(self):
+        """True si el documento ha cambiado (o desaparecido) desde que se indexó."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        if (stat.st_mtime_ns, stat.st_size) == self.stat:
+            return False
+        return file_sha256(self.path) != self.content_hash
+
+    def embeddings_by_hash(self):
+        """Embeddings de los fragmentos indexados por su hash (ver `fragment_hash`)."""
+        return {fragment_hash(text): emb for text, emb in zip(self.fragments, self.embeddings)}
+
+    def result(self, i, score):
+        """Resultado con 'text', 'source', 'offset' y 'score' para el fragmento `i`."""
+        fragments, offsets = self.load()[:2]
+        return {'text': fragments[i], 'source': self.source, 'offset': int(offsets[i]), 'score': score}
+
+    def search(self, query_embs, queries, depth, hybrid=True, stats=None):
+        """
+        Candidatos del documento para cada consulta, con puntuaciones que se pueden
+        comparar con las de otros documentos: similitud coseno y, con `hybrid`,
+        BM25 calculado con las estadísticas `stats` de todo el corpus. La fusión
+        se hace en `Rag.search_batch` sobre las listas de todo el corpus, porque
+        una puntuación de Reciprocal Rank Fusion sólo tiene sentido dentro de una
+        misma clasificación.
+
+        Args:
+            query_embs (np.ndarray): Embeddings normalizados de las consultas, forma (q, d).
+            queries (List[str]): Texto de las consultas, en el mismo orden.
+            depth (int): Candidatos de cada búsqueda.
+            hybrid (bool, opcional): Si True también busca con BM25. Por defecto True.
+            stats (lexical.CorpusStats, opcional): IDF y longitud media comunes a los documentos
+                que se consultan. Sin ellas se usan las del propio documento y las puntuaciones
+                BM25 no son comparables entre documentos.
+
+        Returns:
+            List[Tuple[List[Tuple[float, int]], List[Tuple[float, int]]]]: Para cada consulta, los
+            candidatos densos (coseno, fragmento) y léxicos (BM25, fragmento), de mejor a peor.
+        """
+        _, _, _, index, lexical = self.load()
+        scores, ids = index.search(query_embs, depth)
+        results = []
+        for query, row_scores, row_ids in zip(queries, scores, ids):
+            dense = [(float(score), int(i)) for score, i in zip(row_scores, row_ids) if i >= 0]
+            lexical_hits = []
+            if hybrid:
+                lexical_scores, lexical_ids = lexical.search(query, depth, stats)
+                lexical_hits = [(float(score), int(i)) for score, i in zip(lexical_scores, lexical_ids)]
+            results.append((dense, lexical_hits))
+        return results
+
+
+def list_documents(path, pattern='*.txt'):
+    """
+    Devuelve los documentos a indexar: el propio archivo o los de un directorio.
+
+    Args:
+        path (str): Ruta de un archivo o de un directorio.
+        pattern (str, opcional): Patrón de archivos dentro del directorio. Por defecto '*.txt'.
+
+    Returns:
+        List[str]: Rutas de los documentos, ordenadas.
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, pattern)))
+    return [path]
+
 
 class Rag:
-    def __init__(self, file_path, model_name='all-MiniLM-L6-v2', max_length=500):
+    def __init__(self, file_path, model_name='all-MiniLM-L6-v2', max_length=500, overlap=0, cache_dir='./.rag_cache',
+                 index='exact', workers=4, batch_size=64, embed_workers=0, progress=True, query_cache_size=256,
+                 hybrid=True, fusion_depth=20, background=False, timer=None, **index_options):
         """
-        Inicializa el indexador cargando el texto, dividiéndolo en fragmentos y calculando sus embeddings.
+        Inicializa el indexador leyendo el texto por bloques, dividiéndolo en fragmentos por frases y
+        calculando sus embeddings por lotes, así la memoria no depende del tamaño del documento.
+        Si ya existe un índice en disco para el mismo contenido, modelo y troceado, se reutiliza.
+
+        Si `file_path` es un directorio se indexan todos sus documentos ('*.txt'), cada uno en su
+        propio shard. Los shards que faltan en la caché se construyen en paralelo.
+
+        Con `background=True` el constructor vuelve enseguida: sentence_transformers se importa,
+        el modelo se carga y el índice se prepara en el hilo de rag mientras el programa sigue
+        (p. ej. conectando con la API). Las consultas asíncronas que lleguen antes se encolan
+        detrás de esa preparación y las síncronas esperan a que termine.
 
         Args:
-            file_path (str): Ruta del archivo de texto.
+            file_path (str): Ruta del archivo de texto o de un directorio de documentos.
             model_name (str, opcional): Nombre del modelo de embeddings. Por defecto 'all-MiniLM-L6-v2'.
             max_length (int, opcional): Número máximo de palabras por fragmento. Por defecto 500.
+            overlap (int, opcional): Palabras de solapamiento entre fragmentos consecutivos. Por defecto 0.
+            cache_dir (str | None, opcional): Directorio de la caché de índices. None la desactiva.
+            index (str, opcional): Tipo de índice vectorial: 'exact' o 'ivf' (aproximado). Por defecto 'exact'.
+            workers (int, opcional): Documentos que se indexan a la vez. Por defecto 4.
+            batch_size (int, opcional): Fragmentos por lote de embeddings. Por defecto 64.
+            embed_workers (int | None, opcional): Procesos para calcular embeddings al construir índices.
+                0 los calcula en este proceso; None usa un proceso por núcleo. Por defecto 0.
+            progress (bool, opcional): Si True informa del progreso al construir índices. Por defecto True.
+            query_cache_size (int, opcional): Consultas recientes cuyo embedding y resultado se guardan
+                en memoria. 0 desactiva la caché. Por defecto 256.
+            hybrid (bool, opcional): Si True combina embeddings y BM25 con Reciprocal Rank Fusion. Por defecto True.
+            fusion_depth (int, opcional): Candidatos de cada búsqueda que entran en la fusión. Por defecto 20.
+            background (bool, opcional): Si True prepara modelo e índice en segundo plano. Por defecto False.
+            timer (StartupTimer, opcional): Donde se registra la duración de cada fase del arranque.
+            **index_options: Parámetros del índice, p. ej. `nprobe` para 'ivf' o `precision='int8'` para
+                puntuar primero con una copia compacta en memoria y reordenar los mejores candidatos con
+                los embeddings completos, que se quedan en disco (memoria mapeada).
         """
         self.file_path = file_path
+        self.model_name = model_name
         self.max_length = max_length
-        self.model = SentenceTransformer(model_name)
-        self.text = self.load_text()
-        self.fragments = self.split_text(self.text)
-        self.embeddings = self.make_embeddings(self.fragments)
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.cache_dir = cache_dir
+        self.index_kind = index
+        self.index_options = index_options
+        self.workers = workers
+        self.embed_workers = embed_workers
+        self.progress = progress
+        self.hybrid = hybrid
+        self.fusion_depth = fusion_depth
+        self.timer = timer or StartupTimer()
+        self.model = None
+        self.shards = {}
+        self.query_embeddings = LRUCache(query_cache_size)
+        self.query_results = LRUCache(query_cache_size)
+        self.generation = 0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        # Hilo dedicado a la preparación y a las consultas asíncronas: no compite con el
+        # pool por defecto de asyncio (que usan input(), PyAudio, etc.) y lo atiende todo
+        # en orden, así las consultas tempranas esperan a que el índice esté listo.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rag')
+        self._ready = self._executor.submit(self.start, warm_up=background)
+        if not background:
+            self.wait_ready()
+
+    def start(self, warm_up=False):
+        """
+        Importa sentence_transformers, carga el modelo y prepara los shards. Se ejecuta
+        una vez, en el hilo de rag.
+
+        Args:
+            warm_up (bool, opcional): Si True también carga ya los datos de cada shard, para que
+                la primera consulta no pague esa carga. Por defecto False.
+        """
+        with self.timer.phase('importar sentence_transformers'):
+            from sentence_transformers import SentenceTransformer
+        with self.timer.phase('cargar modelo'):
+            self.model = SentenceTransformer(self.model_name)
+        with self.timer.phase('preparar índice'):
+            try:
+                self.shards = self.build_shards(list_documents(self.file_path))
+            finally:
+                self.close_pool()
+        if warm_up:
+            with self.timer.phase('cargar shards'):
+                for shard in self.shards.values():
+                    shard.load()
+
+    @property
+    def ready(self):
+        """True cuando el modelo y el índice están listos."""
+        return self._ready.done()
+
+    def wait_ready(self, timeout=None):
+        """Espera a que el modelo y el índice estén listos (relanza el error si falló)."""
+        self._ready.result(timeout)
+
+    async def wait_ready_async(self):
+        """Versión asíncrona de `wait_ready`."""
+        await asyncio.wrap_future(self._ready)
+
+    def embedding_pool(self):
+        """Devuelve el pool de procesos de embeddings, creándolo la primera vez (None si no se usa)."""
+        if self.embed_workers == 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = EmbeddingPool(self.model_name, self.embed_workers)
+            return self._pool
+
+    def close_pool(self):
+        """Termina el pool de procesos de embeddings si se ha creado."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def build_shards(self, paths):
+        """
+        Crea un shard por documento. Los que ya están en la caché se cargan de forma
+        perezosa; el resto se construyen en paralelo.
+
+        Args:
+            paths (List[str]): Rutas de los documentos.
+
+        Returns:
+            Dict[str, Shard]: Shards indexados por nombre de documento.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            shards = list(pool.map(self.make_shard, paths))
+        return {shard.source: shard for shard in shards}
+
+    def make_shard(self, file_path, previous=None):
+        """
+        Garantiza que el índice de un documento existe y crea su shard.
+
+        Args:
+            file_path (str): Ruta del documento.
+            previous (Shard, opcional): Versión anterior del documento; sus embeddings se
+                reutilizan para los fragmentos que no han cambiado.
+
+        Returns:
+            Shard: Shard del documento (se carga al consultarlo por primera vez).
+        """
+        stat = os.stat(file_path)
+        content_hash = file_sha256(file_path)
+        reuse = previous.embeddings_by_hash() if previous is not None else None
+        if self.cache_dir is None:
+            data = self.build_document(file_path, reuse)
+            loader = lambda: data
+        else:
+            key = index_key(content_hash, self.model_name, self.max_length, self.overlap)
+            if not index_exists(self.cache_dir, key):
+                self.write_index(file_path, key, reuse)
+            # Las versiones anteriores de este documento ya no se usan.
+            prune_indexes(self.cache_dir, os.path.basename(file_path), keep=(key,), model_name=self.model_name,
+                          max_length=self.max_length, overlap=self.overlap)
+            loader = functools.partial(self.load_cached, file_path, key)
+        return Shard(os.path.basename(file_path), loader, self.index_kind, self.index_options,
+                     path=file_path, content_hash=content_hash, stat=(stat.st_mtime_ns, stat.st_size))
+
+    def write_index(self, file_path, key, reuse=None):
+        """Calcula los embeddings de un documento y los guarda en la caché con la clave `key`."""
+        with IndexWriter(self.cache_dir, key, self.model.get_sentence_embedding_dimension(),
+                         source=os.path.basename(file_path), model_name=self.model_name,
+                         max_length=self.max_length, overlap=self.overlap) as writer:
+            for fragments, offsets, embeddings in self.embed_document(file_path, reuse):
+                writer.add(fragments, offsets, embeddings)
+
+    def load_cached(self, file_path, key):
+        """
+        Carga el índice de un documento desde la caché. Si meta.json es válido pero los
+        datos están dañados o incompletos, o si otro proceso lo ha borrado, se reconstruye.
+
+        Args:
+            file_path (str): Ruta del documento.
+            key (str): Clave del índice (ver `index_key`).
+
+        Returns:
+            Tuple[List[str], np.ndarray, np.ndarray, BM25Index]: Lo mismo que `load_index`.
+        """
+        if (data := load_index(self.cache_dir, key)) is not None:
+            return data
+        index_dir = os.path.join(self.cache_dir, key)
+        print(f"[rag] {os.path.basename(file_path)}: índice dañado o ausente en {index_dir}, se reconstruye")
+        remove_index(self.cache_dir, key)
+        self.write_index(file_path, key)
+        if (data := load_index(self.cache_dir, key)) is None:
+            raise RuntimeError(f"No se puede cargar el índice de {file_path} desde {index_dir}")
+        return data
+
+    def embed_document(self, file_path, reuse=None):
+        """
+        Trocea un documento en streaming y calcula los embeddings por lotes, en este proceso
+        o repartidos en el pool de procesos. Ambos caminos dan los mismos embeddings salvo
+        por el redondeo (ver `encode_batch`).
+
+        Args:
+            file_path (str): Ruta del documento.
+            reuse (Dict[str, np.ndarray], opcional): Embeddings ya calculados por hash de fragmento
+                (ver `fragment_hash`); sólo se calculan los fragmentos que no estén aquí.
+
+        Yields:
+            Tuple[List[str], np.ndarray, np.ndarray]: Fragmentos, posiciones de inicio y embeddings de cada lote.
+        """
+        reuse = reuse or {}
+
+        def batches():
+            for batch in batched(iter_fragments(file_path, self.max_length, self.overlap), self.batch_size):
+                offsets, texts = zip(*batch)
+                known = [reuse.get(fragment_hash(text)) for text in texts]
+                missing = [text for text, emb in zip(texts, known) if emb is None]
+                yield list(texts), np.array(offsets, dtype=np.int64), known, missing
 
-    def load_text(self):
-        """Carga el contenido del archivo de texto."""
-        with open(self.file_path, 'r', encoding='utf-8') as file:
-            return file.read()
+        progress = BuildProgress(os.path.basename(file_path), enabled=self.progress)
+        if (pool := self.embedding_pool()) is None:
+            encoded = ((batch, encode_batch(self.model, batch[3])) for batch in batches())
+        else:
+            encoded = pool.map(batches(), get_texts=lambda batch: batch[3])
+        reused = 0
+        for (texts, offsets, known, missing), new_embeddings in encoded:
+            if missing:
+                new_rows = iter(new_embeddings)
+                embeddings = np.stack([next(new_rows) if emb is None else emb for emb in known])
+            else:
+                embeddings = np.stack(known)
+            reused += len(texts) - len(missing)
+            progress.update(len(texts))
+            yield texts, offsets, embeddings
+        progress.finish()
+        if reuse and self.progress:
+            print(f"[rag] {os.path.basename(file_path)}: {reused} fragmentos sin cambios reutilizados")
 
-    def split_text(self, text):
+    def build_document(self, file_path, reuse=None):
         """
-        Divide el texto en fragmentos de aproximadamente 'max_length' palabras.
+        Trocea un documento y calcula sus índices en memoria (sin caché en disco).
 
         Args:
-            text (str): Texto completo a dividir.
+            file_path (str): Ruta del documento.
+            reuse (Dict[str, np.ndarray], opcional): Embeddings ya calculados por hash de fragmento.
 
         Returns:
-            List[str]: Lista de fragmentos.
+            Tuple[List[str], np.ndarray, np.ndarray, BM25Index]: Fragmentos, posiciones de inicio,
+            embeddings e índice léxico.
         """
-        words = text.split()
-        return [' '.join(words[i:i + self.max_length]) for i in range(0, len(words), self.max_length)]
+        fragments, offsets, embeddings = [], [np.empty(0, dtype=np.int64)], [self.make_embeddings([])]
+        lexical = BM25Builder()
+        for batch_fragments, batch_offsets, batch_embeddings in self.embed_document(file_path, reuse):
+            fragments.extend(batch_fragments)
+            offsets.append(batch_offsets)
+            embeddings.append(batch_embeddings)
+            lexical.add(batch_fragments)
+        return fragments, np.concatenate(offsets), np.concatenate(embeddings), lexical.build()
+
+    def add_document(self, file_path):
+        """
+        Añade o actualiza un documento sin reconstruir el resto del corpus. Si el
+        documento ya existía, sólo se calculan los embeddings de los fragmentos
+        nuevos o modificados. El shard nuevo se construye aparte y se sustituye
+        de una vez, así las consultas en curso nunca ven un índice a medias.
+
+        Args:
+            file_path (str): Ruta del documento.
+
+        Returns:
+            Shard: Shard del documento.
+        """
+        self.wait_ready()
+        source = os.path.basename(file_path)
+        with self._update_lock:
+            try:
+                shard = self.make_shard(file_path, previous=self.shards.get(source))
+            finally:
+                self.close_pool()
+            shard.load()
+            self.shards = {**self.shards, source: shard}
+            self.invalidate_caches()
+        return shard
+
+    update_document = add_document
+
+    def remove_document(self, source):
+        """
+        Quita un documento del corpus.
+
+        Args:
+            source (str): Nombre del documento (ver `sources`).
+        """
+        with self._update_lock:
+            self.shards = {name: shard for name, shard in self.shards.items() if name != source}
+            self.invalidate_caches()
+            if self.cache_dir is not None:
+                prune_indexes(self.cache_dir, source, keep=(), model_name=self.model_name,
+                              max_length=self.max_length, overlap=self.overlap)
+
+    def refresh(self):
+        """
+        Sincroniza el índice con los documentos de `file_path`: añade los nuevos,
+        actualiza los modificados y quita los borrados. Se puede llamar
+        periódicamente mientras el asistente está en marcha. Un documento que no se
+        puede leer (p. ej. no es UTF-8, o se ha borrado o se está escribiendo) se
+        anota en 'failed' y conserva su versión anterior en el índice.
+
+        Returns:
+            Dict[str, List[str]]: Documentos 'added', 'updated', 'removed' y 'failed'.
+        """
+        self.wait_ready()
+        changes = {'added': [], 'updated': [], 'removed': [], 'failed': []}
+        paths = {os.path.basename(path): path for path in list_documents(self.file_path)}
+        for source, path in paths.items():
+            shard = self.shards.get(source)
+            try:
+                if shard is None:
+                    self.add_document(path)
+                    changes['added'].append(source)
+                elif shard.changed_on_disk():
+                    self.update_document(path)
+                    changes['updated'].append(source)
+            except (OSError, ValueError) as e:
+                print(f"[rag] {source}: no se ha podido indexar, se mantiene la versión anterior ({e})")
+                changes['failed'].append(source)
+        for source in set(self.shards) - set(paths):
+            self.remove_document(source)
+            changes['removed'].append(source)
+        return changes
+
+    @property
+    def sources(self):
+        """Nombres de los documentos indexados."""
+        return list(self.shards)
+
+    @property
+    def fragments(self):
+        """Todos los fragmentos del corpus, en el orden de los shards."""
+        return [fragment for shard in self.shards.values() for fragment in shard.fragments]
+
+    @property
+    def embeddings(self):
+        """Matriz con los embeddings de todo el corpus, en el orden de `fragments`."""
+        return np.concatenate([shard.embeddings for shard in self.shards.values()])
 
     def make_embeddings(self, fragments):
         """
-        Calcula los embeddings para cada fragmento.
+        Calcula los embeddings normalizados para cada fragmento.
 
         Args:
             fragments (List[str]): Lista de fragmentos de texto.
 
         Returns:
-            np.array: Array con los embeddings correspondientes.
+            np.array: Array con los embeddings correspondientes (filas de norma 1).
         """
-        return self.model.encode(fragments)
+        return encode_batch(self.model, fragments)
 
-    def get_chunk_relevates(self, query, top_k=3):
+    def invalidate_caches(self):
+        """
+        Descarta los resultados cacheados; se llama cada vez que cambia el índice. La
+        generación forma parte de la clave, así un resultado calculado con los shards
+        anteriores que se guarde después ya no se encuentra.
+        """
+        self.generation += 1
+        self.query_results.clear()
+
+    def embed_queries(self, queries):
+        """
+        Calcula los embeddings de varias consultas en una sola llamada al modelo,
+        reutilizando los que ya están en la caché.
+
+        Args:
+            queries (List[str]): Consultas ya normalizadas (ver `normalize_query`).
+
+        Returns:
+            np.ndarray: Embeddings normalizados, forma (len(queries), d).
+        """
+        cached = [self.query_embeddings.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, emb in zip(queries, cached) if emb is None))
+        if missing:
+            new = dict(zip(missing, normalize(self.model.encode(missing))))
+            for query, emb in new.items():
+                self.query_embeddings.put(query, emb)
+            cached = [new[query] if emb is None else emb for query, emb in zip(queries, cached)]
+        if not cached:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack(cached)
+
+    def search_batch(self, queries, top_k=3, sources=None):
+        """
+        Busca los fragmentos más relevantes para muchas consultas a la vez: las
+        consultas se codifican juntas y cada shard las puntúa en una sola operación
+        matricial. Pensado para evaluación y trabajos offline.
+
+        Args:
+            queries (List[str]): Consultas a evaluar.
+            top_k (int, opcional): Número de fragmentos por consulta. Por defecto 3.
+            sources (Iterable[str], opcional): Documentos en los que buscar. Por defecto todos.
+
+        Returns:
+            List[List[dict]]: Para cada consulta, resultados con 'text', 'source', 'offset' y 'score',
+            del más al menos relevante.
+        """
+        self.wait_ready()
+        # Una sola instantánea: `refresh` puede sustituir `self.shards` mientras se codifican las consultas.
+        shards, generation = self.shards, self.generation
+        sources = tuple(name for name in (shards if sources is None else sources) if name in shards)
+        keys = [(normalize_query(query), top_k, sources, generation) for query in queries]
+        results = [self.query_results.get(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            query_embs = self.embed_queries([keys[i][0] for i in pending])
+            texts = [keys[i][0] for i in pending]
+            depth = max(top_k, self.fusion_depth) if self.hybrid else top_k
+            # BM25 con las estadísticas de todos los documentos consultados, para que sus
+            # puntuaciones se puedan ordenar juntas.
+            stats = CorpusStats(shards[name].lexical for name in sources) if self.hybrid else None
+            per_shard = [(name, shards[name].search(query_embs, texts, depth, self.hybrid, stats))
+                         for name in sources]
+            for row, i in enumerate(pending):
+                # Primero se juntan los candidatos de todos los shards por su puntuación (coseno y
+                # BM25) y después se fusionan una sola vez las dos clasificaciones del corpus.
+                dense = heapq.nlargest(depth, ((score, name, j) for name, found in per_shard
+                                               for score, j in found[row][0]))
+                if self.hybrid:
+                    lexical = heapq.nlargest(depth, ((score, name, j) for name, found in per_shard
+                                                     for score, j in found[row][1]))
+                    ranked = reciprocal_rank_fusion(
+                        [[(name, j) for _, name, j in dense], [(name, j) for _, name, j in lexical]])[:top_k]
+                else:
+                    ranked = [((name, j), score) for score, name, j in dense[:top_k]]
+                results[i] = [shards[name].result(j, score) for (name, j), score in ranked]
+                self.query_results.put(keys[i], results[i])
+        return [[dict(result) for result in query_results] for query_results in results]
+
+    def search(self, query, top_k=3, sources=None):
+        """
+        Busca los fragmentos más relevantes y devuelve también su procedencia.
+
+        Args:
+            query (str): Consulta a evaluar.
+            top_k (int, opcional): Número de fragmentos a devolver. Por defecto 3.
+            sources (Iterable[str], opcional): Documentos en los que buscar. Por defecto todos.
+
+        Returns:
+            List[dict]: Resultados con 'text', 'source', 'offset' y 'score', del más al menos relevante.
+        """
+        return self.search_batch([query], top_k, sources)[0]
+
+    def get_chunk_relevates(self, query, top_k=3, sources=None):
         """
         Devuelve los fragmentos más relevantes para una consulta dada.
 
         Args:
             query (str): Consulta a evaluar.
             top_k (int, opcional): Número de fragmentos a devolver. Por defecto 3.
+            sources (Iterable[str], opcional): Documentos en los que buscar. Por defecto todos.
+
+        Returns:
+            List[str]: Lista de fragmentos relevantes, del más al menos relevante.
+        """
+        return [result['text'] for result in self.search(query, top_k, sources)]
+
+    def get_chunk_relevates_batch(self, queries, top_k=3, sources=None):
+        """
+        Devuelve los fragmentos más relevantes para varias consultas en una sola pasada.
+
+        Args:
+            queries (List[str]): Consultas a evaluar.
+            top_k (int, opcional): Número de fragmentos por consulta. Por defecto 3.
+            sources (Iterable[str], opcional): Documentos en los que buscar. Por defecto todos.
+
+        Returns:
+            List[List[str]]: Para cada consulta, sus fragmentos relevantes, del más al menos relevante.
+        """
+        return [[result['text'] for result in results] for results in self.search_batch(queries, top_k, sources)]
+
+    async def aget_chunk_relevates(self, query, top_k=3, sources=None):
+        """
+        Versión asíncrona de `get_chunk_relevates`: la codificación y la búsqueda se
+        ejecutan en el hilo dedicado de rag, sin bloquear el bucle de eventos.
+        Si la tarea que espera se cancela (p. ej. porque el usuario ya ha hecho
+        otra pregunta) y la búsqueda aún no ha empezado, no llega a ejecutarse.
+
+        Args:
+            query (str): Consulta a evaluar.
+            top_k (int, opcional): Número de fragmentos a devolver. Por defecto 3.
+            sources (Iterable[str], opcional): Documentos en los que buscar. Por defecto todos.
+
+        Returns:
+            List[str]: Lista de fragmentos relevantes, del más al menos relevante.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self.get_chunk_relevates, query, top_k, sources))
+
+    async def arun(self, func, *args):
+        """
+        Ejecuta `func(*args)` en el hilo dedicado de rag, p. ej. una caché que calcula
+        embeddings con el modelo de rag, sin bloquear el bucle de eventos.
 
         Returns:
-            List[str]: Lista de fragmentos relevantes.
+            Any: Lo que devuelva `func`.
         """
-        query_emb = self.model.encode([query])
-        similarities = cosine_similarity(query_emb, self.embeddings)[0]
-        top_indices = np.argsort(similarities)[-top_k:]
-        return [self.fragments[i] for i in top_indices]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def close(self):
+        """Libera el hilo de consultas y el pool de embeddings."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.close_pool()
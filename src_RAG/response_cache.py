@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from query_cache import normalize_query
+
+
+class CachedResponse:
+    """Audio de una respuesta ya generada y lo que costó obtenerla."""
+
+    __slots__ = ('key', 'audio', 'latency', 'created', 'embedding')
+
+    def __init__(self, key, audio, latency, embedding=None):
+        self.key = key
+        self.audio = audio
+        self.latency = latency
+        self.created = time.monotonic()
+        self.embedding = embedding
+
+
+class ResponseCache:
+    """
+    Caché de respuestas de audio por pregunta. Primero busca la pregunta
+    normalizada; si no está y se indica `embed`, busca la pregunta guardada más
+    parecida y la reutiliza si la similitud coseno supera `threshold`. Las
+    entradas caducan a los `max_age` segundos y, al superar `max_entries` o
+    `max_bytes`, se descartan las usadas hace más tiempo. Es segura entre hilos.
+
+    Ejemplo:
+        cache = ResponseCache()
+        if (hit := cache.get(message)) is not None:
+            wav.writeframes(hit.audio)
+        else:
+            ...
+            cache.put(message, audio, latency)
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 << 20, max_age=3600, embed=None, threshold=0.92):
+        """
+        Args:
+            max_entries (int, opcional): Número máximo de respuestas. 0 desactiva la caché. Por defecto 128.
+            max_bytes (int, opcional): Bytes de audio máximos entre todas las respuestas. Por defecto 64 MiB.
+            max_age (float, opcional): Segundos que vale una respuesta. None para que no caduquen.
+                Por defecto 3600.
+            embed (Callable[[str], np.ndarray], opcional): Calcula el embedding normalizado de una
+                pregunta ya normalizada. Sin él (por defecto) sólo se reutilizan preguntas iguales.
+                Con él se puede servir la respuesta de una pregunta *distinta* pero parecida, y dos
+                preguntas muy parecidas pueden pedir cosas opuestas ("¿quién ganó?" / "¿quién
+                perdió?"): conviene activarlo sólo a propósito. `get` y `put` lo llaman, así que
+                desde un bucle de eventos deben ejecutarse en otro hilo.
+            threshold (float, opcional): Similitud coseno mínima para reutilizar una respuesta
+                parecida. Por defecto 0.92.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.embed = embed
+        self.threshold = threshold
+        self.nbytes = 0
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fracción de consultas servidas desde la caché."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _expired(self, entry, now):
+        return self.max_age is not None and now - entry.created > self.max_age
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= len(entry.audio)
+
+    def _similar(self, embedding, now):
+        """Entrada vigente más parecida a `embedding` si supera el umbral."""
+        candidates = [entry for entry in self._entries.values()
+                      if entry.embedding is not None and not self._expired(entry, now)]
+        if not candidates:
+            return None
+        scores = np.stack([entry.embedding for entry in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.threshold else None
+
+    def get(self, prompt):
+        """
+        Busca una respuesta para `prompt`.
+
+        Args:
+            prompt (str): Pregunta del usuario.
+
+        Returns:
+            CachedResponse | None: La respuesta guardada o None si no hay ninguna válida.
+        """
+        if self.max_entries <= 0:
+            return None
+        key = normalize_query(prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.monotonic()):
+                self._evict(key)
+                entry = None
+            if entry is None and (self.embed is None or not self._entries):
+                self.misses += 1
+                return None
+        if entry is None:
+            # El embedding se calcula fuera del candado porque puede tardar.
+            embedding = np.asarray(self.embed(key), dtype=np.float32)
+            with self._lock:
+                entry = self._similar(embedding, time.monotonic())
+                if entry is None:
+                    self.misses += 1
+                    return None
+                self.similar_hits += 1
+        with self._lock:
+            if entry.key in self._entries:
+                self._entries.move_to_end(entry.key)
+            self.hits += 1
+            self.latency_saved += entry.latency
+        return entry
+
+    def put(self, prompt, audio, latency):
+        """
+        Guarda la respuesta de `prompt`.
+
+        Args:
+            prompt (str): Pregunta del usuario.
+            audio (bytes): PCM completo de la respuesta.
+            latency (float): Segundos que tardó el modelo en generarla; es lo que ahorra cada acierto.
+        """
+        if self.max_entries <= 0 or not audio or len(audio) > self.max_bytes:
+            return
+        key = normalize_query(prompt)
+        embedding = np.asarray(self.embed(key), dtype=np.float32) if self.embed is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = CachedResponse(key, bytes(audio), latency, embedding)
+            self.nbytes += len(audio)
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        """Vacía la caché (p. ej. cuando cambian los documentos de los que salen las respuestas)."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def report(self, label="caché de respuestas"):
+        """Muestra aciertos, tasa de acierto y latencia ahorrada."""
+        print(
+            f"\n[{label}] respuestas={len(self)} ({self.nbytes / 1e6:.1f} MB) "
+            f"aciertos={self.hits} (parecidas={self.similar_hits}) fallos={self.misses} "
+            f"tasa={self.hit_rate:.0%} latencia ahorrada={self.latency_saved:.2f} s"
+        )
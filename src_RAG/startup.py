@@ -0,0 +1,52 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """
+    Registra cuánto dura cada fase del arranque (importaciones, modelo, índice,
+    conexión, audio...). Las fases pueden solaparse porque se ejecutan en
+    paralelo; el informe muestra cuándo empieza y cuánto dura cada una.
+
+    Ejemplo:
+        timer = StartupTimer()
+        with timer.phase("conexión"):
+            ...
+        timer.report()
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def record(self, name, started, finished=None):
+        """
+        Registra una fase ya terminada.
+
+        Args:
+            name (str): Nombre de la fase.
+            started (float): Instante de inicio (`time.perf_counter()`).
+            finished (float, opcional): Instante de fin. Por defecto, ahora.
+        """
+        finished = time.perf_counter() if finished is None else finished
+        with self._lock:
+            self.phases.append((name, started - self.start, finished - started))
+
+    @contextmanager
+    def phase(self, name):
+        """Mide la duración del bloque `with` como una fase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def report(self, label="arranque"):
+        """Muestra las fases en orden de inicio y el tiempo total hasta ahora."""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        print(f"\n[{label}] total={time.perf_counter() - self.start:.2f} s")
+        for name, offset, duration in phases:
+            print(f"  +{offset:6.2f} s  {duration:6.2f} s  {name}")
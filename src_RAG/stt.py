@@ -1,24 +1,116 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import speech_recognition as sr
 
+
+class GoogleEngine:
+    """Reconocimiento con el servicio web de Google (necesita red)."""
+
+    name = "google"
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def recognize(self, audio, language="es-ES", final=True):
+        return self.recognizer.recognize_google(audio, language=language)
+
+
+class SphinxEngine:
+    """
+    Reconocimiento local con CMU Sphinx (paquete `pocketsphinx`), sin red.
+    Para español hay que instalar el modelo de idioma "es-ES".
+    """
+
+    name = "sphinx"
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def recognize(self, audio, language="es-ES", final=True):
+        return self.recognizer.recognize_sphinx(audio, language=language)
+
+
+class ScriptedEngine:
+    """
+    Motor de pruebas sin red ni modelos: cada intervención se "reconoce" como el
+    siguiente texto del guion. Los parciales devuelven tantas palabras como
+    correspondan a la duración del audio recibido, así se puede probar el modo
+    en streaming con cualquier fichero de audio.
+    """
+
+    name = "guion"
+
+    def __init__(self, transcripts, words_per_second=2.5, delay=0.0):
+        """
+        Parámetros:
+            transcripts: Lista de textos, uno por intervención, en orden.
+            words_per_second: Palabras "dichas" por segundo de audio en los parciales.
+            delay: Segundos que tarda cada reconocimiento (simula la latencia de un servicio).
+        """
+        self.transcripts = deque(transcripts)
+        self.words_per_second = words_per_second
+        self.delay = delay
+
+    def recognize(self, audio, language="es-ES", final=True):
+        time.sleep(self.delay)
+        if not self.transcripts:
+            raise sr.UnknownValueError()
+        if final:
+            return self.transcripts.popleft()
+        words = self.transcripts[0].split()
+        seconds = len(audio.frame_data) / audio.sample_width / audio.sample_rate
+        spoken = min(len(words), int(seconds * self.words_per_second))
+        if not spoken:
+            raise sr.UnknownValueError()
+        return " ".join(words[:spoken])
+
+
+ENGINES = {"google": GoogleEngine, "sphinx": SphinxEngine}
+
+
+def rms(buffer):
+    """Energía RMS de un trozo PCM int16, en la misma escala que `energy_threshold`."""
+    samples = np.frombuffer(buffer, dtype='<i2').astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
 class EasySpeechRecognizer:
-    def __init__(self, energy_threshold=300, pause_threshold=0.8, dynamic_energy_threshold=True):
+    def __init__(self, energy_threshold=300, pause_threshold=0.8, dynamic_energy_threshold=True, engine=None):
         """
         Inicializa el reconocedor con parámetros configurables.
-        
+
         Parámetros:
             energy_threshold: Nivel mínimo de energía para considerar el audio como voz.
             pause_threshold: Tiempo de silencio (en segundos) que determina el fin de la intervención.
             dynamic_energy_threshold: Si True, ajusta dinámicamente el umbral de energía.
+            engine: Motor de reconocimiento: "google", "sphinx" o un objeto con
+                `recognize(audio, language, final)` (p. ej. `ScriptedEngine`). Por defecto Google.
         """
         self.recognizer = sr.Recognizer()
         self.recognizer.energy_threshold = energy_threshold
         self.recognizer.pause_threshold = pause_threshold
         self.recognizer.dynamic_energy_threshold = dynamic_energy_threshold
-        
+        if engine is None or isinstance(engine, str):
+            engine = ENGINES[engine or "google"](self.recognizer)
+        self.engine = engine
+        # Los parciales se reconocen en su propio hilo para no dejar de leer el micrófono.
+        self._partial_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-parcial")
+        self._partial_future = None
+        self._utterance = 0
+        self._last_partial = None
+        self.partials = 0
+        self.partials_skipped = 0
+
     def calibrate(self, duration=1):
         """
         Calibra el reconocedor para el ruido ambiental.
-        
+
         Parámetros:
             duration: Duración en segundos para realizar la calibración.
         """
@@ -26,33 +118,313 @@ class EasySpeechRecognizer:
             print("Calibrando el ruido ambiental...")
             self.recognizer.adjust_for_ambient_noise(source, duration=duration)
             print(f"Calibración completada: energy_threshold={self.recognizer.energy_threshold}")
-            
+
+    def recognize(self, audio, language="es-ES", final=True):
+        """
+        Pasa el audio al motor configurado.
+
+        Retorna:
+            El texto reconocido o None en caso de error.
+        """
+        try:
+            return self.engine.recognize(audio, language=language, final=final)
+        except sr.UnknownValueError:
+            if final:
+                print("No se pudo entender el audio.")
+            return None
+        except sr.RequestError as e:
+            print(f"Error al conectarse al servicio: {e}")
+            return None
+
     def listen_and_recognize(self, language="es-ES"):
         """
-        Escucha a través del micrófono y convierte la voz a texto utilizando el servicio de Google.
-        
+        Escucha a través del micrófono y convierte la voz a texto utilizando el motor configurado.
+
         Parámetros:
             language: Código de idioma (por defecto español: "es-ES").
-            
+
         Retorna:
             El texto reconocido o None en caso de error.
         """
         with sr.Microphone() as source:
             print("Habla ahora...")
             audio = self.recognizer.listen(source)
-        try:
-            texto = self.recognizer.recognize_google(audio, language=language)
+        texto = self.recognize(audio, language=language)
+        if texto is not None:
             print("Texto reconocido:", texto)
-            return texto
-        except sr.UnknownValueError:
-            print("No se pudo entender el audio.")
-            return None
-        except sr.RequestError as e:
-            print(f"Error al conectarse al servicio: {e}")
+        return texto
+
+    def capture_utterance(self, source, on_audio=None, partial_interval=0.8, timeout=None, stop=None):
+        """
+        Lee de `source` una intervención completa con el mismo criterio que
+        `Recognizer.listen` (umbral de energía y `pause_threshold`), pero
+        entregando el audio acumulado mientras el usuario habla.
+
+        Parámetros:
+            source: Fuente ya abierta (`sr.Microphone` o `sr.AudioFile`) con audio int16.
+            on_audio: Se llama con el `sr.AudioData` acumulado cada `partial_interval` segundos de voz.
+            partial_interval: Segundos de audio entre entregas parciales.
+            timeout: Segundos máximos esperando a que empiece la voz (None = sin límite).
+            stop: `threading.Event` que, si se activa mientras se espera la voz, termina la lectura.
+
+        Retorna:
+            El `sr.AudioData` de la intervención, o None si se agota `timeout`, se activa `stop`
+            o se acaba el audio.
+        """
+        r = self.recognizer
+        seconds_per_buffer = source.CHUNK / source.SAMPLE_RATE
+        pause_buffers = math.ceil(r.pause_threshold / seconds_per_buffer)
+        preroll = deque(maxlen=math.ceil(r.non_speaking_duration / seconds_per_buffer))
+        waited = 0.0
+        while True:
+            buffer = source.stream.read(source.CHUNK)
+            if not buffer:
+                return None
+            energy = rms(buffer)
+            if energy > r.energy_threshold:
+                break
+            preroll.append(buffer)
+            if r.dynamic_energy_threshold:
+                # Misma adaptación al ruido de fondo que `Recognizer.listen`.
+                damping = r.dynamic_energy_adjustment_damping ** seconds_per_buffer
+                r.energy_threshold = r.energy_threshold * damping + energy * r.dynamic_energy_ratio * (1 - damping)
+            waited += seconds_per_buffer
+            if (timeout is not None and waited > timeout) or (stop is not None and stop.is_set()):
+                return None
+        frames = list(preroll) + [buffer]
+        silent_buffers = 0
+        since_partial = 0.0
+        while silent_buffers < pause_buffers:
+            buffer = source.stream.read(source.CHUNK)
+            if not buffer:
+                break
+            frames.append(buffer)
+            silent_buffers = 0 if rms(buffer) > r.energy_threshold else silent_buffers + 1
+            since_partial += seconds_per_buffer
+            if on_audio is not None and since_partial >= partial_interval:
+                since_partial = 0.0
+                on_audio(sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH))
+        return sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def _recognize_partial(self, audio, language, on_partial, utterance):
+        texto = self.recognize(audio, language=language, final=False)
+        if texto is None or utterance != self._utterance:
+            return
+        # Un parcial es estable cuando más audio no cambia la hipótesis anterior.
+        stable = texto == self._last_partial
+        self._last_partial = texto
+        self.partials += 1
+        on_partial(texto, stable)
+
+    def capture_with_partials(self, source, on_partial, language="es-ES", partial_interval=0.8, timeout=None,
+                              stop=None):
+        """
+        `capture_utterance` que además reconoce parciales en su hilo y se los pasa a
+        `on_partial(texto, estable)`. Los parciales que siguen en marcha al terminar la
+        intervención ya no se entregan.
+
+        Retorna:
+            El `sr.AudioData` de la intervención o None (ver `capture_utterance`).
+        """
+        def on_audio(audio):
+            if on_partial is None:
+                return
+            if self._partial_future is not None and not self._partial_future.done():
+                self.partials_skipped += 1
+                return
+            self._partial_future = self._partial_executor.submit(
+                self._recognize_partial, audio, language, on_partial, self._utterance)
+
+        self._last_partial = None
+        audio = self.capture_utterance(source, on_audio, partial_interval, timeout, stop)
+        self._utterance += 1
+        return audio
+
+    def listen_streaming(self, on_partial=None, language="es-ES", source=None, partial_interval=0.8, timeout=None):
+        """
+        Modo en streaming: mientras el usuario habla se reconocen hipótesis
+        parciales y se pasan a `on_partial(texto, estable)`; al terminar la
+        intervención se reconoce el audio completo. Si un parcial aún no ha
+        terminado cuando llega el siguiente trozo de audio, ese trozo se salta.
+
+        Parámetros:
+            on_partial: Función que recibe cada hipótesis parcial y si es estable (se llama desde
+                el hilo de los parciales).
+            language: Código de idioma (por defecto español: "es-ES").
+            source: Fuente ya abierta; por defecto se abre el micrófono.
+            partial_interval: Segundos de voz entre hipótesis parciales.
+            timeout: Segundos máximos esperando a que empiece la voz (None = sin límite).
+
+        Retorna:
+            El texto reconocido o None en caso de error.
+        """
+        if source is None:
+            with sr.Microphone() as source:
+                print("Habla ahora...")
+                return self.listen_streaming(on_partial, language, source, partial_interval, timeout)
+        audio = self.capture_with_partials(source, on_partial, language, partial_interval, timeout)
+        if audio is None:
             return None
+        texto = self.recognize(audio, language=language)
+        if texto is not None:
+            print("Texto reconocido:", texto)
+        return texto
+
+class BackgroundListener:
+    """
+    Escucha continua con un único micrófono abierto: un hilo lee sin parar y
+    separa las intervenciones; cada una se reconoce en otro hilo mientras se
+    sigue capturando la siguiente, y los textos llegan en orden a una cola
+    de asyncio. El umbral de energía adaptativo se conserva entre turnos
+    porque siempre se usa el mismo `Recognizer`.
+
+    Ejemplo:
+        listener = BackgroundListener(EasySpeechRecognizer())
+        await asyncio.to_thread(listener.start, asyncio.get_running_loop())
+        while True:
+            texto = await listener.get()
+    """
+
+    def __init__(self, recognizer, language="es-ES", on_partial=None, partial_interval=0.8, maxsize=16):
+        """
+        Parámetros:
+            recognizer: `EasySpeechRecognizer` con el motor y los umbrales a usar.
+            language: Código de idioma (por defecto español: "es-ES").
+            on_partial: Si se indica, recibe los parciales como en `listen_streaming`.
+            partial_interval: Segundos de voz entre hipótesis parciales.
+            maxsize: Textos pendientes de leer; si se llena se descarta el más antiguo.
+        """
+        self.recognizer = recognizer
+        self.language = language
+        self.on_partial = on_partial
+        self.partial_interval = partial_interval
+        self.maxsize = maxsize
+        self.queue = None
+        self.loop = None
+        self.source = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._owns_source = False
+        self.error = None
+        # Un solo hilo de reconocimiento: los textos salen en el orden en que se habló.
+        self._final_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-final")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.utterances = 0
+        self.overlapped = 0
+        self.dropped = 0
+        self.recognition_times = []
+
+    def start(self, loop, calibrate=1.0, source=None):
+        """
+        Abre el micrófono (una sola vez), calibra el ruido y arranca el hilo de captura.
+        Bloquea mientras calibra: desde asyncio llamarlo con `asyncio.to_thread`.
+
+        Parámetros:
+            loop: Bucle de eventos al que se entregan los textos.
+            calibrate: Segundos de calibración del ruido ambiental (0 = sin calibrar).
+            source: Fuente ya abierta; por defecto `sr.Microphone()`.
+        """
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.source = source if source is not None else sr.Microphone().__enter__()
+        self._owns_source = source is None
+        if calibrate:
+            print("Calibrando el ruido ambiental...")
+            self.recognizer.recognizer.adjust_for_ambient_noise(self.source, duration=calibrate)
+            print(f"Calibración completada: energy_threshold={self.recognizer.recognizer.energy_threshold}")
+        self._thread = threading.Thread(target=self._capture, name="stt-captura", daemon=True)
+        self._thread.start()
+
+    def _capture(self):
+        try:
+            while not self._stop.is_set():
+                audio = self.recognizer.capture_with_partials(
+                    self.source, self.on_partial, self.language, self.partial_interval, stop=self._stop)
+                if audio is None:
+                    break
+                self.utterances += 1
+                with self._lock:
+                    # La intervención anterior aún se está reconociendo mientras se capturaba esta.
+                    self.overlapped += self._pending > 0
+                    self._pending += 1
+                self._final_executor.submit(self._recognize, audio, time.perf_counter())
+        except Exception as e:
+            # `get` lo vuelve a lanzar al llegar al fin, en vez de esperar para siempre.
+            self.error = e
+        finally:
+            # El fin se entrega detrás de los textos que aún se estén reconociendo.
+            self._final_executor.submit(self.loop.call_soon_threadsafe, self._deliver, None)
+
+    def _recognize(self, audio, captured):
+        try:
+            texto = self.recognizer.recognize(audio, language=self.language)
+        finally:
+            self.recognition_times.append(time.perf_counter() - captured)
+            with self._lock:
+                self._pending -= 1
+        if texto is not None:
+            print("Texto reconocido:", texto)
+            self.loop.call_soon_threadsafe(self._deliver, texto)
+
+    def _deliver(self, texto):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(texto)
+
+    async def get(self):
+        """
+        Siguiente texto reconocido.
+
+        Retorna:
+            El texto, o None si la escucha ha terminado (`stop` o fin del audio). Si el hilo
+            de captura ha fallado, en lugar de None se lanza su excepción.
+        """
+        texto = await self.queue.get()
+        if texto is None and self.error is not None:
+            raise self.error
+        return texto
+
+    def stop(self):
+        """Detiene la captura y cierra el micrófono."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._final_executor.shutdown(wait=True)
+        if self._owns_source:
+            self.source.__exit__(None, None, None)
+
+    def report(self, label="escucha continua"):
+        """Muestra las intervenciones, cuántas se reconocieron mientras se capturaba otra y el tiempo medio."""
+        times = self.recognition_times
+        mean = 1000 * sum(times) / len(times) if times else 0.0
+        print(
+            f"\n[{label}] intervenciones={self.utterances} solapadas={self.overlapped} "
+            f"reconocimiento medio={mean:.0f} ms descartadas={self.dropped} "
+            f"energy_threshold={self.recognizer.recognizer.energy_threshold:.0f}"
+        )
+
 
 # Ejemplo de uso
 if __name__ == "__main__":
-    recognizer = EasySpeechRecognizer(energy_threshold=300, pause_threshold=1.0)
-    recognizer.calibrate(duration=1)
-    texto = recognizer.listen_and_recognize(language="es-ES")
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--motor", choices=sorted(ENGINES), default="google", help="Motor de reconocimiento")
+    parser.add_argument("--audio", default=None, metavar="WAV",
+                        help="Reconoce un fichero en vez del micrófono (modo streaming)")
+    parser.add_argument("--guion", nargs="+", default=None, metavar="TEXTO",
+                        help="Usa el motor de pruebas con estos textos, sin red")
+    args = parser.parse_args()
+
+    engine = ScriptedEngine(args.guion) if args.guion else args.motor
+    recognizer = EasySpeechRecognizer(energy_threshold=300, pause_threshold=1.0, engine=engine)
+    show = lambda texto, estable: print(f"  ... {texto}{' (estable)' if estable else ''}")
+    if args.audio:
+        with sr.AudioFile(args.audio) as source:
+            while recognizer.listen_streaming(show, language="es-ES", source=source, timeout=5) is not None:
+                pass
+    else:
+        recognizer.calibrate(duration=1)
+        texto = recognizer.listen_streaming(show, language="es-ES")
@@ -0,0 +1,273 @@
+import numpy as np
+
+
+def normalize(vectors):
+    """
+    Normaliza cada fila a norma 1 para que el producto escalar sea la similitud coseno.
+
+    Args:
+        vectors (np.ndarray): Matriz (n, d) o vector (d,).
+
+    Returns:
+        np.ndarray: Matriz float32 con filas de norma 1.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_rows(scores, top_k):
+    """
+    Devuelve los índices de las `top_k` puntuaciones más altas de cada fila,
+    ordenados de mayor a menor, usando `argpartition` en lugar de ordenar todo.
+
+    Args:
+        scores (np.ndarray): Matriz (q, n) de puntuaciones.
+        top_k (int): Número de resultados por fila.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Puntuaciones e índices, ambos de forma (q, k).
+    """
+    top_k = min(top_k, scores.shape[1])
+    if top_k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+    if top_k < scores.shape[1]:
+        ids = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        ids = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part = np.take_along_axis(scores, ids, axis=1)
+    order = np.argsort(-part, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class CompactVectors:
+    """
+    Copia compacta de los vectores para la primera pasada de puntuación:
+    float16 (la mitad de memoria) o int8 con una escala por vector (la cuarta
+    parte). Las puntuaciones son aproximadas; los mejores candidatos se
+    vuelven a puntuar con los vectores completos (ver `rerank`).
+    """
+
+    def __init__(self, vectors, precision='int8', block_size=8192):
+        """
+        Args:
+            vectors (np.ndarray): Matriz (n, d) con filas de norma 1 (puede ser memoria mapeada).
+            precision (str, opcional): 'float16' o 'int8'. Por defecto 'int8'.
+            block_size (int, opcional): Filas que se convierten a float32 a la vez al puntuar,
+                para que la memoria temporal no dependa de n. Por defecto 8192.
+        """
+        self.precision = precision
+        self.block_size = block_size
+        self.scales = None
+        if precision == 'float16':
+            self.data = np.asarray(vectors, dtype=np.float16)
+        elif precision == 'int8':
+            self.data = np.empty(vectors.shape, dtype=np.int8)
+            self.scales = np.empty(vectors.shape[0], dtype=np.float32)
+            for start in range(0, vectors.shape[0], block_size):
+                block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+                scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127
+                self.data[start:start + block_size] = np.round(block / scales[:, None])
+                self.scales[start:start + block_size] = scales
+        else:
+            raise ValueError(f"Precisión desconocida: {precision!r}. Opciones: float16, int8")
+
+    @property
+    def nbytes(self):
+        """Memoria ocupada por la copia compacta."""
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, queries, ids=None):
+        """
+        Puntuaciones aproximadas de cada consulta contra los vectores (o sólo contra `ids`).
+
+        Args:
+            queries (np.ndarray): Matriz (q, d) de consultas normalizadas.
+            ids (np.ndarray, opcional): Filas a puntuar. Por defecto todas.
+
+        Returns:
+            np.ndarray: Matriz (q, n) o (q, len(ids)) de puntuaciones.
+        """
+        data = self.data if ids is None else self.data[ids]
+        scales = self.scales if ids is None or self.scales is None else self.scales[ids]
+        out = np.empty((queries.shape[0], data.shape[0]), dtype=np.float32)
+        for start in range(0, data.shape[0], self.block_size):
+            stop = start + self.block_size
+            out[:, start:stop] = queries @ data[start:stop].astype(np.float32).T
+        if scales is not None:
+            out *= scales
+        return out
+
+
+def rerank(vectors, queries, candidates, top_k):
+    """
+    Vuelve a puntuar los candidatos con los vectores completos y se queda con los `top_k`.
+    Sólo se leen del disco las filas de los candidatos.
+
+    Args:
+        vectors (np.ndarray): Matriz completa (n, d), normalmente memoria mapeada.
+        queries (np.ndarray): Matriz (q, d) de consultas normalizadas.
+        candidates (np.ndarray): Índices candidatos (q, c); -1 indica hueco.
+        top_k (int): Número de resultados por consulta.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Puntuaciones exactas e índices (q, k), de mayor a menor.
+    """
+    valid = candidates >= 0
+    rows = np.asarray(vectors[np.where(valid, candidates, 0).ravel()], dtype=np.float32)
+    exact = np.einsum('qcd,qd->qc', rows.reshape(*candidates.shape, -1), queries)
+    exact[~valid] = -np.inf
+    scores, order = top_k_rows(exact, top_k)
+    ids = np.take_along_axis(candidates, order, axis=1)
+    ids[~np.isfinite(scores)] = -1
+    return scores, ids
+
+
+class ExactIndex:
+    """
+    Búsqueda exacta: producto escalar contra todas las filas ya normalizadas.
+    Con `precision` 'float16' o 'int8' la primera pasada usa una copia compacta
+    en memoria y los `top_k * rerank` mejores se reordenan con los vectores completos.
+    """
+
+    def __init__(self, vectors, precision='float32', rerank=4):
+        """
+        Args:
+            vectors (np.ndarray): Matriz (n, d) con filas de norma 1 (puede ser memoria mapeada).
+            precision (str, opcional): 'float32', 'float16' o 'int8'. Por defecto 'float32'.
+            rerank (int, opcional): Candidatos por resultado que se reordenan con precisión
+                completa cuando `precision` no es 'float32'. Por defecto 4.
+        """
+        self.vectors = vectors
+        self.rerank = rerank
+        self.compact = None if precision == 'float32' else CompactVectors(vectors, precision)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, queries, top_k):
+        """
+        Busca los vecinos más cercanos de cada consulta.
+
+        Args:
+            queries (np.ndarray): Matriz (q, d) de consultas normalizadas.
+            top_k (int): Número de resultados por consulta.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Puntuaciones e índices (q, k), de mayor a menor.
+        """
+        if self.compact is None:
+            return top_k_rows(queries @ self.vectors.T, top_k)
+        _, candidates = top_k_rows(self.compact.scores(queries), top_k * self.rerank)
+        return rerank(self.vectors, queries, candidates, top_k)
+
+
+class IVFIndex:
+    """
+    Búsqueda aproximada tipo IVF: los vectores se agrupan con k-means y cada
+    consulta sólo se compara con los `nprobe` grupos más cercanos. Subir
+    `nprobe` mejora el recall a costa de latencia; con `nprobe >= n_lists`
+    el resultado coincide con `ExactIndex`. Admite la misma `precision` que
+    `ExactIndex` para puntuar los candidatos de los grupos explorados.
+    """
+
+    def __init__(self, vectors, n_lists=None, nprobe=None, iterations=10, seed=0, precision='float32', rerank=4):
+        """
+        Args:
+            vectors (np.ndarray): Matriz (n, d) con filas de norma 1.
+            n_lists (int, opcional): Número de grupos. Por defecto ~sqrt(n).
+            nprobe (int, opcional): Grupos que se exploran por consulta. Por defecto el 10 % de
+                `n_lists` (al menos 8). Cada consulta compara con unos `nprobe / n_lists` de los
+                vectores: con vectores poco agrupados (p. ej. aleatorios) el recall es bajo con
+                pocos grupos, y conviene subirlo si importa más el recall que la latencia.
+            iterations (int, opcional): Iteraciones de k-means. Por defecto 10.
+            seed (int, opcional): Semilla para que el índice sea reproducible.
+            precision (str, opcional): 'float32', 'float16' o 'int8'. Por defecto 'float32'.
+            rerank (int, opcional): Candidatos por resultado que se reordenan con precisión completa.
+        """
+        self.vectors = vectors
+        self.rerank = rerank
+        self.compact = None if precision == 'float32' else CompactVectors(vectors, precision)
+        n = vectors.shape[0]
+        n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        self.nprobe = nprobe or max(8, -(-n_lists // 10))
+        self.centroids, assignments = self._kmeans(np.asarray(vectors), n_lists, iterations, seed)
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @staticmethod
+    def _kmeans(vectors, n_lists, iterations, seed):
+        """k-means esférico sencillo; devuelve centroides normalizados y asignaciones."""
+        if vectors.shape[0] == 0:
+            return np.empty((0, vectors.shape[1]), dtype=np.float32), np.empty(0, dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].astype(np.float32)
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+    def search(self, queries, top_k):
+        """
+        Busca los vecinos aproximados de cada consulta.
+
+        Args:
+            queries (np.ndarray): Matriz (q, d) de consultas normalizadas.
+            top_k (int): Número de resultados por consulta.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Puntuaciones e índices (q, k), de mayor a menor.
+            Si los grupos explorados tienen menos de `top_k` vectores, se rellena con índice -1.
+        """
+        scores = np.full((queries.shape[0], top_k), -np.inf, dtype=np.float32)
+        ids = np.full((queries.shape[0], top_k), -1, dtype=np.int64)
+        if len(self) == 0:
+            return scores, ids
+        nprobe = min(self.nprobe, len(self.lists))
+        _, probes = top_k_rows(queries @ self.centroids.T, nprobe)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.lists[i] for i in lists])
+            candidates.sort()
+            if self.compact is None:
+                part_scores, part_ids = top_k_rows((self.vectors[candidates] @ query)[None, :], top_k)
+                part_ids = candidates[part_ids]
+            else:
+                _, part_ids = top_k_rows(self.compact.scores(query[None, :], candidates), top_k * self.rerank)
+                part_scores, part_ids = rerank(self.vectors, query[None, :], candidates[part_ids], top_k)
+            scores[row, :part_ids.shape[1]] = part_scores[0]
+            ids[row, :part_ids.shape[1]] = part_ids[0]
+        return scores, ids
+
+
+INDEX_TYPES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+
+
+def make_index(kind, vectors, **options):
+    """
+    Crea un índice vectorial del tipo indicado.
+
+    Args:
+        kind (str): 'exact' o 'ivf'.
+        vectors (np.ndarray): Matriz (n, d) con filas de norma 1.
+        **options: Parámetros del índice: `precision` y `rerank` en ambos, `nprobe` y `n_lists` en 'ivf'.
+
+    Returns:
+        ExactIndex | IVFIndex: Índice listo para `search`.
+    """
+    try:
+        index_cls = INDEX_TYPES[kind]
+    except KeyError:
+        raise ValueError(f"Tipo de índice desconocido: {kind!r}. Opciones: {', '.join(INDEX_TYPES)}") from None
+    return index_cls(vectors, **options)